@@ -125,10 +125,13 @@ import streamlit as st
 import os
 import glob
 from PIL import Image
-import torch
 import config
 from core.ai_engine import AIEngine
 from core.db_manager import DBManager
+from core.ingest_pipeline import IngestPipeline
+from core.manifest import IndexManifest
+from core.caption_backfill import CaptionBackfill
+from core.reduction import stored_dimension
 
 # --- تنظیمات صفحه ---
 st.set_page_config(page_title="Neural Search Dashboard", page_icon="🧠", layout="wide")
@@ -142,6 +145,9 @@ except Exception as e:
     st.error(f"❌ System Error: {e}")
     st.stop()
 
+# لود پس‌زمینه مدل پیش‌فرض (config.PRELOAD_MODEL)
+ai.preload()
+
 # --- SIDEBAR: تنظیمات ---
 with st.sidebar:
     st.header("⚙️ Batch Config")
@@ -153,7 +159,7 @@ with st.sidebar:
     
     # نمایش اطلاعات مدل
     target_info = config.MODELS_CONFIG[selected_model]
-    st.info(f"Target Collection:\n`{target_info['collection_name']}`\nDim: `{target_info['dimension']}`")
+    st.info(f"Target Collection:\n`{target_info['collection_name']}`\nDim: `{stored_dimension(selected_model)}`")
     
     st.divider()
     
@@ -161,15 +167,47 @@ with st.sidebar:
     # برای مدل‌های سنگین مثل Nemo، عدد کمتر (مثلاً 8 یا 16) بهتر است
     batch_size = st.slider("Batch Size", 4, 128, 16)
     
-    # 3. تولید کپشن (اختیاری)
-    enable_caption = st.checkbox("Generate Captions (Optional)", value=False)
+    # 3. تعداد thread های خواندن عکس و اندازه صف پیش‌خوان
+    decode_workers = st.slider("Decode Workers", 1, 16, 4)
+    prefetch_batches = st.slider("Prefetch Batches", 1, 16, 4)
+
+    # 4. تولید کپشن (اختیاری): همراه ایندکس (مرحله جدا در پایپ‌لاین) یا بعداً در پس‌زمینه
+    caption_mode = st.radio("Captions (Optional)", ["Off", "During indexing", "After indexing (background)"])
+    if caption_mode != "Off":
+        caption_tokens = st.slider("Caption max new tokens", 10, 60, config.CAPTION_MAX_NEW_TOKENS)
+        caption_beams = st.slider("Caption beams (1 = greedy)", 1, 5, config.CAPTION_NUM_BEAMS)
+
+    # 5. حالت افزایشی: فقط فایل‌های جدید/تغییرکرده ایندکس می‌شوند
+    incremental = st.checkbox("Incremental (skip already-indexed files)", value=True)
+
+    st.divider()
+
+    # 6. مدل‌های لودشده در حافظه (با سقف MODEL_MEMORY_BUDGET_GB)
+    with st.expander("🧠 Resident Models"):
+        model_rows, model_totals = ai.model_memory_stats()
+        budget = f"{model_totals['budget_mb']:.0f} MB" if model_totals["budget_mb"] else "unlimited"
+        st.caption(f"{model_totals['resident_mb']:.0f} MB / {budget} — {model_totals['evictions']} evictions")
+        if model_rows: st.table(model_rows)
+        if st.button("♻️ Release All Models"):
+            ai.models.clear()
+            st.rerun()
 
 # --- MAIN AREA ---
 default_path = config.IMAGE_STORAGE_PATH
 dataset_path = st.text_input("📁 Dataset Path:", value=default_path)
 
+def start_caption_backfill():
+    job = CaptionBackfill(
+        ai, db, selected_model,
+        max_new_tokens=caption_tokens, num_beams=caption_beams,
+        manifest=IndexManifest(target_info['collection_name']),
+    )
+    if not job.start():
+        st.warning("⏳ A caption backfill is already running for this collection.")
+
 # دکمه بررسی وضعیت دیتابیس
-if st.button("📊 Check Status"):
+col_status, col_backfill = st.columns(2)
+if col_status.button("📊 Check Status"):
     try:
         col_name = target_info['collection_name']
         if db.client.has_collection(col_name):
@@ -181,6 +219,22 @@ if st.button("📊 Check Status"):
     except Exception as e:
         st.error(f"Error checking DB: {e}")
 
+if caption_mode != "Off" and col_backfill.button("📝 Backfill Missing Captions"):
+    start_caption_backfill()
+
+# وضعیت job کپشن پس‌زمینه (بین rerun ها باقی می‌ماند)
+backfill_job = CaptionBackfill.jobs.get(target_info['collection_name'])
+if backfill_job is not None:
+    bf = backfill_job.status()
+    label = "⏳ Caption backfill running" if bf["running"] else "✅ Caption backfill finished"
+    st.info(f"{label}: {bf['done']} / {bf['total']} rows, {bf['updated']} captioned, "
+            f"{bf['errors']} errors ({bf['items_per_s']} img/s)")
+    if bf["failure"]: st.error(f"❌ Backfill stopped: {bf['failure']}")
+    if bf["running"]:
+        col_refresh, col_stop = st.columns(2)
+        if col_refresh.button("🔄 Refresh"): st.rerun()
+        if col_stop.button("⏹️ Stop Backfill"): backfill_job.stop()
+
 st.divider()
 
 # --- دکمه شروع عملیات ---
@@ -202,10 +256,26 @@ if st.button("🚀 Start Batch Indexing", type="primary"):
         
     st.info(f"Found **{len(image_files)}** images. Starting indexing with **{selected_model}**...")
     
-    # 2. اطمینان از وجود دیتابیس
+    # 2. بررسی manifest (همیشه ثبت می‌شود؛ تیک Incremental فقط رد کردن فایل‌ها را تعیین می‌کند)
+    manifest = IndexManifest(target_info['collection_name'])
+    # کالکشن پاک شده -> manifest ریست؛ کالکشن قدیمی بدون manifest -> از ردیف‌های موجود پر می‌شود
+    seeded = manifest.sync(db, selected_model)
+    if seeded:
+        st.info(f"📒 Seeded manifest with **{seeded}** files already in the collection.")
+    if incremental:
+        image_files, stale_ids, skipped = manifest.plan(image_files)
+        if stale_ids:
+            # نسخه قدیمی فایل‌های تغییرکرده را حذف کن تا تکراری نشوند
+            db.delete_by_ids(selected_model, stale_ids)
+        st.info(f"⏭️ Skipping **{skipped}** already-indexed images; **{len(image_files)}** new or changed.")
+        if not image_files:
+            st.success("✅ Collection is already up to date.")
+            st.stop()
+
+    # 3. اطمینان از وجود دیتابیس
     db.ensure_collection(selected_model)
 
-    # 3. لود کردن مدل (زمان‌بر برای مدل‌های بزرگ)
+    # 4. لود کردن مدل (زمان‌بر برای مدل‌های بزرگ)
     with st.spinner(f"Loading {selected_model}... (Please wait)"):
         try:
             ai.load_embedding_model(selected_model)
@@ -213,73 +283,58 @@ if st.button("🚀 Start Batch Indexing", type="primary"):
             st.error(f"❌ Failed to load model: {e}")
             st.stop()
 
-    # 4. شروع حلقه پردازش
+    # 5. شروع پایپ‌لاین (decode / embed / insert به صورت همزمان)
     progress_bar = st.progress(0)
     status_text = st.empty()
     error_container = st.empty()
     
     total_files = len(image_files)
-    processed_count = 0
-    error_count = 0
-    
-    # حلقه اصلی (Batch Loop)
-    for i in range(0, total_files, batch_size):
-        batch_paths = image_files[i : i + batch_size]
-        
-        vectors = []
-        valid_paths = []
-        captions = []
-
-        # پردازش هر عکس در بچ
-        for path in batch_paths:
-            try:
-                # الف) تولید بردار (این تابع خودش لاجیک Nemo/CLIP را هندل می‌کند)
-                vec = ai.get_embedding(model_key=selected_model, image=path)
-                
-                # ب) تولید کپشن (اگر تیک زده باشید)
-                cap = ""
-                if enable_caption:
-                    cap = ai.generate_caption(path)
-                
-                if vec is not None:
-                    vectors.append(vec)
-                    valid_paths.append(path)
-                    captions.append(cap)
-            
-            except Exception as e:
-                # نمایش خطا در کنسول (ترمینال) برای دیباگ
-                print(f"❌ Error processing {path}: {e}")
-                error_count += 1
-                if error_count <= 5: # فقط ۵ ارور اول را در صفحه نشان بده که شلوغ نشود
-                    error_container.warning(f"Skipped {os.path.basename(path)}: {e}")
-                continue
-        
-        # ج) ذخیره در دیتابیس (فقط اگر بردار معتبری ساخته شده باشد)
-        if vectors:
-            # ساخت ساختار داده مناسب برای Milvus
-            data_to_insert = []
-            for idx, v in enumerate(vectors):
-                data_to_insert.append({
-                    "vector": v,
-                    "path": valid_paths[idx],
-                    "caption": captions[idx]
-                })
-            
-            try:
-                # اینسرت مستقیم برای سرعت بیشتر
-                db.client.insert(target_info['collection_name'], data_to_insert)
-                processed_count += len(data_to_insert)
-            except Exception as e:
-                st.error(f"❌ DB Insert Error: {e}")
-                # اگر دیتابیس قطع شده باشد، ادامه دادن بی‌فایده است
-                st.stop()
-
-        # د) آپدیت نوار پیشرفت
-        progress = min((i + batch_size) / total_files, 1.0)
-        progress_bar.progress(progress)
-        status_text.text(f"🚀 Indexed {processed_count} / {total_files} images... (Errors: {error_count})")
+    shown = {"errors": 0}
+
+    def on_progress(done, total, pipe):
+        # نمایش خطاهای جدید (فقط ۵ ارور اول را در صفحه نشان بده که شلوغ نشود)
+        for path, err in pipe.errors[shown["errors"]:]:
+            print(f"❌ Error processing {path}: {err}")
+            if shown["errors"] < 5:
+                error_container.warning(f"Skipped {os.path.basename(path)}: {err}")
+            shown["errors"] += 1
+        progress_bar.progress(min(done / total, 1.0))
+        status_text.text(f"🚀 Indexed {pipe.inserted} / {total} images... (Errors: {len(pipe.errors)})")
+
+    pipeline = IngestPipeline(
+        ai, db, selected_model,
+        batch_size=batch_size,
+        decode_workers=decode_workers,
+        prefetch_batches=prefetch_batches,
+        caption_fn=(lambda paths: ai.generate_captions(paths, max_new_tokens=caption_tokens, num_beams=caption_beams))
+                   if caption_mode == "During indexing" else None,
+        manifest=manifest,
+    )
+    try:
+        processed_count = pipeline.run(image_files, on_progress=on_progress)
+    except Exception as e:
+        st.error(f"❌ DB Insert Error: {e}")
+        # اگر دیتابیس قطع شده باشد، ادامه دادن بی‌فایده است
+        st.stop()
+
+    progress_bar.progress(1.0)
+    status_text.text(f"🚀 Indexed {processed_count} / {total_files} images... (Errors: {len(pipeline.errors)})")
+    error_count = len(pipeline.errors)
 
     st.balloons()
     st.success(f"🎉 Done! Successfully indexed **{processed_count}** images.")
+    st.markdown("#### ⏱️ Stage Throughput")
+    st.table(pipeline.report())
+    token_store = ai.token_store(selected_model)
+    if token_store is not None:
+        st.caption(f"🧩 Token store (late interaction): {len(token_store)} images, "
+                   f"{token_store.disk_bytes() / 2**20:.0f} MB on disk")
     if error_count > 0:
-        st.warning(f"⚠️ Skipped {error_count} images due to errors. Check terminal logs for details.")
\ No newline at end of file
+        st.warning(f"⚠️ Skipped {error_count} images due to errors. Check terminal logs for details.")
+    if pipeline.caption_errors:
+        st.warning(f"⚠️ {len(pipeline.caption_errors)} images were indexed without a caption "
+                   f"(e.g. {os.path.basename(pipeline.caption_errors[0][0])}: {pipeline.caption_errors[0][1]}). "
+                   "Use Backfill Missing Captions to retry.")
+    if caption_mode == "After indexing (background)":
+        start_caption_backfill()
+        st.info("📝 Caption backfill started in the background.")
\ No newline at end of file
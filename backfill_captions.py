@@ -0,0 +1,33 @@
+# backfill_captions.py
+# تولید کپشن BLIP برای ردیف‌هایی که بدون کپشن ایندکس شده‌اند (به‌روزرسانی درجا در Milvus)
+import argparse
+import config
+from core.ai_engine import AIEngine
+from core.caption_backfill import CaptionBackfill
+from core.db_manager import DBManager
+from core.manifest import IndexManifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caption already indexed rows whose caption is empty.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("--batch-size", type=int, default=config.CAPTION_BATCH_SIZE)
+    parser.add_argument("--max-new-tokens", type=int, default=config.CAPTION_MAX_NEW_TOKENS)
+    parser.add_argument("--beams", type=int, default=config.CAPTION_NUM_BEAMS, help="1 = greedy")
+    args = parser.parse_args()
+
+    collection_name = config.MODELS_CONFIG[args.model]["collection_name"]
+    job = CaptionBackfill(
+        AIEngine(), DBManager(), args.model,
+        batch_size=args.batch_size, max_new_tokens=args.max_new_tokens, num_beams=args.beams,
+        manifest=IndexManifest(collection_name),
+    )
+
+    def on_progress(job):
+        s = job.status()
+        print(f"📝 {s['done']} / {s['total']} rows, {s['updated']} captioned, {s['errors']} errors ({s['items_per_s']} img/s)")
+
+    job.run(progress=on_progress)
+    for path, message in job.errors[:20]:
+        print(f"⚠️ {path}: {message}")
+    print(f"🎉 Captioned {job.updated} rows in '{collection_name}'.")
@@ -0,0 +1,276 @@
+# benchmark_index.py
+# سنجش recall@k و latency/QPS برای تنظیمات مختلف ایندکس روی بردارهای واقعی کالکشن‌ها
+#
+# مثال‌ها:
+#   python benchmark_index.py --model "Jina CLIP v2" --source milvus
+#   python benchmark_index.py --model SigLIP --source cache --backend numpy
+#   python benchmark_index.py --source random --n 20000 --dim 512          (کاملاً آفلاین)
+#   python benchmark_index.py --model SigLIP --backend milvus --uri ./bench_lite.db   (Milvus Lite)
+import argparse
+import csv
+import time
+import numpy as np
+import config
+
+# نوع ایندکس -> (پارامترهای ساخت، لیست پارامترهای جستجو برای sweep)
+INDEX_SWEEP = {
+    "FLAT": ({}, [{}]),
+    "HNSW": ({"M": 16, "efConstruction": 200}, [{"ef": ef} for ef in (16, 32, 64, 128, 256)]),
+    "IVF_FLAT": ({"nlist": 256}, [{"nprobe": p} for p in (1, 4, 8, 16, 32, 64)]),
+    "IVF_SQ8": ({"nlist": 256}, [{"nprobe": p} for p in (4, 16, 64)]),
+    "IVF_PQ": ({"nlist": 256, "m": 16, "nbits": 8}, [{"nprobe": p} for p in (4, 16, 64)]),
+    "DISKANN": ({}, [{"search_list": s} for s in (20, 50, 100, 200)]),
+}
+
+
+# ------------------------------------------------------------------
+# داده
+# ------------------------------------------------------------------
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def load_vectors(source, model_key=None, limit=100000, n=20000, dim=512, seed=0):
+    if source == "milvus":
+        from core.db_manager import DBManager
+        data = DBManager().load_collection_arrays(model_key, fields=("vector",), limit=limit)
+        return _normalize(data["vector"]) if len(data["vector"]) else np.empty((0, dim), np.float32)
+    if source == "cache":
+        from core.embedding_cache import EmbeddingCache
+        cache = EmbeddingCache(config.MODELS_CONFIG[model_key]["model_id"])
+        parts = [vecs for _, vecs in cache.iter_batches(batch_size=4096, only_existing=False)]
+        return _normalize(np.concatenate(parts)[:limit]) if parts else np.empty((0, dim), np.float32)
+    # داده مصنوعی خوشه‌ای برای اجرای آفلاین
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 100, 8), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), n)
+    return _normalize(centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def split_queries(vectors, n_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = rng.permutation(len(vectors))
+    return vectors[idx[n_queries:]], vectors[idx[:n_queries]]
+
+
+def ground_truth(base, queries, k, block=1024):
+    """Exact top-k by brute-force cosine (rows are normalised)."""
+    gt = np.empty((len(queries), k), dtype=np.int64)
+    for s in range(0, len(queries), block):
+        scores = queries[s : s + block] @ base.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        gt[s : s + block] = np.take_along_axis(top, order, axis=1)
+    return gt
+
+
+# ------------------------------------------------------------------
+# بک‌اندها: build(index_type, build_params, base) -> bool ، search(q, k, params) -> ids
+# ------------------------------------------------------------------
+class NumpyBackend:
+    """In-process FLAT and IVF_FLAT (k-means coarse quantizer); always available."""
+
+    name = "numpy"
+    supported = ("FLAT", "IVF_FLAT")
+
+    def build(self, index_type, build_params, base):
+        if index_type not in self.supported: return False
+        self.index_type = index_type
+        self.base = base
+        if index_type == "IVF_FLAT":
+            nlist = min(build_params.get("nlist", 256), len(base))
+            self.centroids = self._kmeans(base, nlist)
+            assign = np.argmax(base @ self.centroids.T, axis=1)
+            self.lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+        return True
+
+    @staticmethod
+    def _kmeans(x, k, iters=10, seed=0):
+        rng = np.random.default_rng(seed)
+        sample = x[rng.choice(len(x), min(len(x), k * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(k):
+                members = sample[assign == c]
+                if len(members): centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        return centroids
+
+    def search(self, query, k, params):
+        if self.index_type == "FLAT":
+            candidates = None
+            scores = self.base @ query
+        else:
+            probe = np.argsort(-(self.centroids @ query))[: params.get("nprobe", 8)]
+            candidates = np.concatenate([self.lists[c] for c in probe])
+            scores = self.base[candidates] @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top if candidates is None else candidates[top]
+
+    def close(self):
+        pass
+
+
+class HnswlibBackend:
+    """HNSW via the optional ``hnswlib`` package."""
+
+    name = "hnswlib"
+    supported = ("HNSW",)
+
+    def __init__(self):
+        import hnswlib
+        self.hnswlib = hnswlib
+
+    def build(self, index_type, build_params, base):
+        if index_type not in self.supported: return False
+        self.index = self.hnswlib.Index(space="cosine", dim=base.shape[1])
+        self.index.init_index(max_elements=len(base), M=build_params.get("M", 16),
+                              ef_construction=build_params.get("efConstruction", 200))
+        self.index.add_items(base, np.arange(len(base)))
+        return True
+
+    def search(self, query, k, params):
+        self.index.set_ef(max(params.get("ef", 64), k))
+        labels, _ = self.index.knn_query(query, k=k)
+        return labels[0]
+
+    def close(self):
+        pass
+
+
+class MilvusBackend:
+    """Real Milvus (server URI) or Milvus Lite (local ``.db`` file path)."""
+
+    name = "milvus"
+    supported = tuple(INDEX_SWEEP)
+
+    def __init__(self, uri):
+        from pymilvus import MilvusClient, DataType
+        self.client = MilvusClient(uri=uri)
+        self.DataType = DataType
+        self.MilvusClient = MilvusClient
+        self.col_name = None
+
+    def build(self, index_type, build_params, base):
+        self.close()
+        self.col_name = f"bench_{index_type.lower()}"
+        schema = self.MilvusClient.create_schema(auto_id=False)
+        schema.add_field("id", self.DataType.INT64, is_primary=True)
+        schema.add_field("vector", self.DataType.FLOAT_VECTOR, dim=base.shape[1])
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(field_name="vector", index_type=index_type, metric_type="COSINE", params=build_params)
+        try:
+            self.client.create_collection(collection_name=self.col_name, schema=schema, index_params=index_params)
+        except Exception as e:
+            print(f"⚠️ {index_type} not supported by this Milvus: {e}")
+            return False
+        for s in range(0, len(base), 2000):
+            ids = np.arange(s, min(s + 2000, len(base)))
+            self.client.insert(self.col_name, [{"id": int(i), "vector": base[i]} for i in ids])
+        self.client.flush(self.col_name)
+        self.client.load_collection(self.col_name)
+        self.index_type = index_type
+        return True
+
+    def search(self, query, k, params):
+        params = dict(params)
+        if self.index_type == "HNSW": params["ef"] = max(params.get("ef", k), k)
+        res = self.client.search(collection_name=self.col_name, data=[query], limit=k,
+                                 search_params={"metric_type": "COSINE", "params": params})
+        return np.array([hit["id"] for hit in res[0]], dtype=np.int64)
+
+    def close(self):
+        if self.col_name and self.client.has_collection(self.col_name):
+            self.client.drop_collection(self.col_name)
+        self.col_name = None
+
+
+# ------------------------------------------------------------------
+# اجرای sweep
+# ------------------------------------------------------------------
+def evaluate(backend, queries, gt, k, params, warmup=5):
+    for q in queries[:warmup]:
+        backend.search(q, k, params)
+    latencies, hits = [], 0
+    for q, truth in zip(queries, gt):
+        start = time.perf_counter()
+        ids = backend.search(q, k, params)
+        latencies.append(time.perf_counter() - start)
+        hits += len(np.intersect1d(ids[:k], truth, assume_unique=True))
+    lat_ms = np.array(latencies) * 1000
+    return {
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 3),
+        "qps": round(float(len(queries) / (lat_ms.sum() / 1000)), 1),
+    }
+
+
+def run_sweep(backends, base, queries, k, index_types):
+    gt = ground_truth(base, queries, k)
+    rows = []
+    for backend in backends:
+        for index_type in index_types:
+            build_params, param_grid = INDEX_SWEEP[index_type]
+            start = time.perf_counter()
+            if not backend.build(index_type, build_params, base): continue
+            build_s = time.perf_counter() - start
+            for params in param_grid:
+                row = {"backend": backend.name, "index": index_type, "build": build_params,
+                       "search": params, "build_s": round(build_s, 2)}
+                row.update(evaluate(backend, queries, gt, k, params))
+                print(row)
+                rows.append(row)
+        backend.close()
+    return rows
+
+
+def make_backends(names, uri):
+    backends = []
+    for name in names:
+        if name == "numpy":
+            backends.append(NumpyBackend())
+        elif name == "hnswlib":
+            try:
+                backends.append(HnswlibBackend())
+            except ImportError:
+                print("⚠️ hnswlib is not installed; skipping HNSW in-process backend.")
+        elif name == "milvus":
+            backends.append(MilvusBackend(uri))
+    return backends
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall / latency benchmark for vector index configurations.")
+    parser.add_argument("--model", choices=list(config.MODELS_CONFIG.keys()), default="SigLIP")
+    parser.add_argument("--source", choices=["milvus", "cache", "random"], default="random")
+    parser.add_argument("--backend", nargs="+", choices=["numpy", "hnswlib", "milvus"], default=["numpy", "hnswlib"])
+    parser.add_argument("--uri", default="./bench_lite.db", help="Milvus URI or Milvus Lite file for --backend milvus")
+    parser.add_argument("--index", nargs="+", choices=list(INDEX_SWEEP), default=list(INDEX_SWEEP))
+    parser.add_argument("--limit", type=int, default=100000, help="max vectors to load from milvus/cache")
+    parser.add_argument("--n", type=int, default=20000, help="vectors for --source random")
+    parser.add_argument("--dim", type=int, default=512, help="dim for --source random")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--csv", help="write results to this CSV file")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.source, args.model, limit=args.limit, n=args.n, dim=args.dim)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"❌ Need more than {args.queries} vectors, got {len(vectors)}.")
+    base, queries = split_queries(vectors, args.queries)
+    print(f"📊 base={base.shape} queries={queries.shape} k={args.k}")
+
+    rows = run_sweep(make_backends(args.backend, args.uri), base, queries, args.k, args.index)
+
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Saved {len(rows)} rows to {args.csv}")
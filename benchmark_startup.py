@@ -0,0 +1,82 @@
+# benchmark_startup.py
+# زمان import ماژول‌ها و اولین رندر هر صفحه Streamlit، هر اندازه‌گیری در یک پروسه تازه (cold start)
+#
+# مثال‌ها:
+#   python benchmark_startup.py
+#   python benchmark_startup.py --runs 5 --pages pages/Cleanup.py pages/Search.py
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["config", "core.db_manager", "core.ai_engine", "core.ingest_pipeline"]
+HEAVY = ["torch", "transformers", "open_clip", "onnxruntime"]
+
+
+def _child_import(module):
+    start = time.perf_counter()
+    __import__(module)
+    return {"seconds": time.perf_counter() - start}
+
+
+def _child_render(page, timeout):
+    from streamlit.testing.v1 import AppTest
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=timeout)
+    at.run()
+    # خطای اتصال به Milvus و ... هم گزارش می‌شود؛ زمان رندر همچنان معتبر است
+    errors = [e.value for e in at.exception] + [e.value for e in at.error]
+    return {"seconds": time.perf_counter() - start, "errors": errors[:1]}
+
+
+def measure(kind, target, timeout):
+    """Run one measurement in a fresh interpreter and return its JSON result."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", kind, target, "--timeout", str(timeout)]
+    out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=timeout + 60)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode != 0 or not lines:
+        return {"seconds": float("nan"), "errors": [out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"]}
+    return json.loads(lines[-1])
+
+
+def run(kind, targets, runs, timeout):
+    rows = []
+    for target in targets:
+        results = [measure(kind, target, timeout) for _ in range(runs)]
+        seconds = [r["seconds"] for r in results]
+        row = {kind: target, "median_s": round(statistics.median(seconds), 3), "max_s": round(max(seconds), 3),
+               "heavy_imports": ",".join(results[-1].get("heavy", [])) or "-"}
+        errors = results[-1].get("errors")
+        if errors: row["note"] = str(errors[0])[:80]
+        print(row)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import and first-render latency of the app and its pages.")
+    parser.add_argument("--pages", nargs="+", default=["app.py"] + sorted(glob.glob("pages/*.py", root_dir=ROOT)))
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--child", nargs=2, metavar=("KIND", "TARGET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, target = args.child
+        sys.path.insert(0, ROOT)
+        result = _child_import(target) if kind == "module" else _child_render(target, args.timeout)
+        # کدام کتابخانه سنگین واقعاً import شد (با lazy import باید خالی باشد مگر مدل اجرا شده باشد)
+        result["heavy"] = [m for m in HEAVY if m in sys.modules]
+        print(json.dumps(result, default=str))
+        sys.exit(0)
+
+    print(f"📦 Module import ({args.runs} cold runs each)")
+    run("module", args.modules, args.runs, args.timeout)
+    print(f"\n🖥️ Page first render ({args.runs} cold runs each)")
+    run("page", args.pages, args.runs, args.timeout)
@@ -0,0 +1,75 @@
+# check_precision.py
+# مقایسه خروجی دقت‌های مختلف (bf16 / int8_dynamic / onnx ...) با مرجع fp32 با cosine similarity
+#
+# مثال:
+#   python check_precision.py SigLIP --precision bf16 int8_dynamic onnx --n 64
+import argparse
+import glob
+import os
+import sys
+import time
+import numpy as np
+import config
+from core.ai_engine import AIEngine
+from core.precision import PRECISIONS, resolve_precision
+
+DEFAULT_TEXTS = [
+    "a dog running on the beach",
+    "two children playing football in a park",
+    "a man riding a bicycle on a city street",
+    "a woman holding an umbrella in the rain",
+]
+
+
+def embed(ai, model_key, precision, paths, texts, batch_size):
+    start = time.perf_counter()
+    images = []
+    for s in range(0, len(paths), batch_size):
+        batch = ai.prepare_image_batch(model_key, paths[s : s + batch_size], precision=precision)
+        images.append(ai.embed_image_batch(model_key, batch, precision=precision))
+    image_s = time.perf_counter() - start
+    text_vectors = ai.embed_text_batch(model_key, texts, precision=precision)
+    return np.concatenate(images), text_vectors, image_s
+
+
+def cosine_rows(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cosine parity of reduced-precision inference against fp32.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("--precision", nargs="+", choices=[p for p in PRECISIONS if p != "fp32"],
+                        default=["bf16", "int8_dynamic"])
+    parser.add_argument("--images", default=config.IMAGE_STORAGE_PATH)
+    parser.add_argument("--n", type=int, default=32, help="number of images to compare")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS)
+    parser.add_argument("--threshold", type=float, default=0.99, help="minimum per-item cosine to pass")
+    args = parser.parse_args()
+
+    paths = sorted(p for ext in ("jpg", "jpeg", "png") for p in glob.glob(os.path.join(args.images, f"*.{ext}")))[: args.n]
+    if not paths:
+        raise SystemExit(f"❌ No images found in {args.images}")
+
+    ai = AIEngine()
+    ref_images, ref_texts, ref_s = embed(ai, args.model, "fp32", paths, args.texts, args.batch_size)
+    print(f"📏 fp32 reference: {len(paths)} images in {ref_s:.2f}s")
+
+    failed = False
+    for requested in args.precision:
+        # هر بار فقط یک نسخه از مدل در حافظه بماند
+        AIEngine.models.clear()
+        precision = resolve_precision(args.model, requested)
+        images, texts, seconds = embed(ai, args.model, precision, paths, args.texts, args.batch_size)
+        image_cos, text_cos = cosine_rows(ref_images, images), cosine_rows(ref_texts, texts)
+        ok = min(image_cos.min(), text_cos.min()) >= args.threshold
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {requested} (ran as {precision}): "
+              f"image cos min={image_cos.min():.4f} mean={image_cos.mean():.4f} | "
+              f"text cos min={text_cos.min():.4f} mean={text_cos.mean():.4f} | "
+              f"{seconds:.2f}s ({ref_s / max(seconds, 1e-9):.2f}x vs fp32)")
+
+    sys.exit(1 if failed else 0)
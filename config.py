@@ -1,12 +1,103 @@
 # config.py
-import torch
+import os
 
 # --- تنظیمات عمومی ---
 MILVUS_URI = "http://milvus-standalone:19530" 
 IMAGE_STORAGE_PATH = "/home/jovyan/work/benchmark/data/flickr30k/Images"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# DEVICE در اولین دسترسی تعیین می‌شود (پایین فایل) تا import کردن config، torch را لود نکند
 
 CAPTION_MODEL = "Salesforce/blip-image-captioning-base" 
+CAPTION_BATCH_SIZE = 16
+CAPTION_MAX_NEW_TOKENS = 30
+CAPTION_NUM_BEAMS = 1  # 1 = greedy؛ بیشتر = beam search (کندتر، کپشن کمی بهتر)
+# کپشن‌هایی که backfill دوباره می‌سازد (خالی + خروجی خطای نسخه‌های قدیمی)
+CAPTION_MISSING_VALUES = ["", "error in ai engine"]
+
+# --- وضعیت محلی (manifest ها، کش‌ها) ---
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+MANIFEST_DIR = os.path.join(STATE_DIR, "manifests")
+
+# کش امبدینگ روی دیسک (کلید: هش محتوای عکس + model_id)
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_DIR = os.path.join(STATE_DIR, "embedding_cache")
+EMBED_CACHE_DTYPE = "float16"  # بردارها نرمال هستند، float16 کافی است
+
+# بردارهای توکنی (late interaction / MaxSim) برای مدل‌های چندبرداری
+TOKEN_STORE_DIR = os.path.join(STATE_DIR, "token_store")
+
+# ماتریس‌های PCA برای کاهش ابعاد
+REDUCTION_DIR = os.path.join(STATE_DIR, "reduction")
+
+# انکودرهای تصویر export شده به ONNX
+ONNX_DIR = os.path.join(STATE_DIR, "onnx")
+
+# --- حافظه مدل‌ها ---
+# سقف حافظه مدل‌های لودشده (گیگابایت)؛ با عبور از آن کم‌استفاده‌ترین مدل آزاد می‌شود. None = بدون سقف
+# (Nemo-3B با fp32 حدود 12GB است؛ re-score با مدل دوم هر دو مدل را با هم لازم دارد)
+MODEL_MEMORY_BUDGET_GB = 16
+# مدلی که هنگام شروع برنامه در پس‌زمینه لود می‌شود (مثلاً "Jina CLIP v2")؛ None = غیرفعال
+PRELOAD_MODEL = None
+
+# کش LRU داخل پروسه برای امبدینگ کوئری‌ها (متن / عکس)
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_TTL = 3600  # ثانیه؛ None یعنی بدون انقضا
+
+# کش نتایج جستجو: یک بار تا سقف اسلایدر (50) می‌گیریم، بقیه از حافظه
+RESULT_CACHE_SIZE = 128
+RESULT_CACHE_TTL = 300
+RESULT_CACHE_FETCH_K = 50
+
+# جستجوی دو مرحله‌ای: تعداد کاندیدای مرحله اول ANN
+RERANK_CANDIDATES = 100
+# تعداد تصویر در هر forward مدل re-score (کاندیداها تکه‌تکه امبد می‌شوند، نه همه با هم)
+RERANK_BATCH_SIZE = 16
+
+# جستجوی ترکیبی: BM25 روی کپشن‌ها (ایندکس معکوس محلی) + بردار، ادغام با RRF یا وزن‌دهی
+TEXT_INDEX_DIR = os.path.join(STATE_DIR, "text_index")
+TEXT_INDEX_CHECK_TTL = 30   # ثانیه بین بررسی تعداد ردیف‌های کالکشن برای بازسازی ایندکس
+HYBRID_CANDIDATES = 100     # کاندیدای هر طرف (بردار / کلمه) قبل از ادغام
+HYBRID_RRF_K = 60
+
+# --- تنظیمات ایندکس برداری ---
+# پارامترهای ساخت پیش‌فرض هر نوع ایندکس (هر مدل می‌تواند در "index" بازنویسی کند)
+INDEX_BUILD_DEFAULTS = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "DISKANN": {},
+    "FLAT": {},
+    # فقط برای storage = "binary"
+    "BIN_FLAT": {},
+    "BIN_IVF_FLAT": {"nlist": 1024},
+}
+# پارامتر زمان جستجو متناظر با هر نوع ایندکس
+INDEX_SEARCH_DEFAULTS = {
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "DISKANN": {"search_list": 100},
+    "FLAT": {},
+    "BIN_FLAT": {},
+    "BIN_IVF_FLAT": {"nprobe": 16},
+}
+DEFAULT_INDEX = {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}}
+
+# فرمت ذخیره بردار در Milvus برای هر مدل ("storage"):
+#   float32 (پیش‌فرض) / float16 / int8 (Milvus >= 2.6) / binary (Hamming، برای فیلتر اولیه + re-rank)
+# برای کالکشن‌های موجود با migrate_collection.py تبدیل کنید، نه با تغییر مستقیم این مقدار.
+
+# کاهش ابعاد اختیاری ("reduction")؛ "dimension" همیشه خروجی کامل مدل است:
+#   {"method": "matryoshka", "dim": 256}  -> برش Matryoshka (Jina CLIP v2)
+#   {"method": "pca", "dim": 256}         -> PCA (اول fit_reduction.py را اجرا کنید)
+# کالکشن کاهش‌یافته ابعاد متفاوتی دارد؛ collection_name جدید بدهید و با rebuild_from_cache.py پر کنید.
+
+# دقت اجرای مدل ("precision")؛ قبل از تغییر با check_precision.py مقایسه کنید:
+#   fp32 (پیش‌فرض، مرجع) / fp16 (فقط GPU) / bf16 (CPU یا GPU)
+#   int8_dynamic (CPU؛ لایه‌های Linear با torch.ao.quantization)
+#   onnx (CPU؛ انکودر تصویر SigLIP / CLIPA با ONNX Runtime، متن با torch)
+# embedding cache بین دقت‌ها مشترک است؛ اگر برابری cosine پایین بود کش را پاک کنید.
 
 # --- تنظیمات مدل‌ها ---
 MODELS_CONFIG = {
@@ -14,31 +105,66 @@ MODELS_CONFIG = {
         "model_id": "google/siglip-so400m-patch14-384",
         "collection_name": "siglip_gallery_v3_captioned",
         "dimension": 1152,
-        "type": "siglip"
+        "type": "siglip",
+        "index": {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "storage": "float32",
+        "precision": "fp32"
     },
     "Jina CLIP v1": {
         "model_id": "jinaai/jina-clip-v1", 
         "collection_name": "jina_clip_v1_embedding",
         "dimension": 768,
-        "type": "jina"
+        "type": "jina",
+        "index": {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "storage": "float32",
+        "precision": "fp32"
     },
     "Jina CLIP v2": {
         "model_id": "jinaai/jina-clip-v2", 
         "collection_name": "jina_clip_v2_embedding",
         "dimension": 1024,
-        "type": "jina"
+        "type": "jina",
+        "index": {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "storage": "float32",
+        "precision": "fp32"
     },
     "CLIPA-v2 (ViT-H-14)": {
         "model_id": "hf-hub:UCSC-VLAA/ViT-H-14-CLIPA-336-laion2B", 
         "collection_name": "clipa_v2_h14_336",
         "dimension": 1024,
-        "type": "open_clip"
+        "type": "open_clip",
+        "index": {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "storage": "float32",
+        "precision": "fp32"
     },
     # 👇 مدل جدید Llama Nemo Retriever (Multimodal)
     "Llama-Nemo-3B": {
         "model_id": "nvidia/llama-nemoretriever-colembed-3b-v1",
         "collection_name": "llama_nemo_3b_multimodal",
         "dimension": 3072, # ابعاد دقیق مدل
-        "type": "llama_nemo" # نوع جدید برای هندل کردن لاجیک خاص
+        "type": "llama_nemo", # نوع جدید برای هندل کردن لاجیک خاص
+        # "late_interaction": بردار میانگین برای کاندیدا در Milvus، سپس MaxSim روی توکن‌های ذخیره‌شده.
+        # هزینه دیسک: توکن‌های هر تصویر زیر TOKEN_STORE_DIR (int8، pool=2 -> حدود 1 MB برای هر تصویر)؛
+        # پس پیش‌فرض "single" است و باید آگاهانه روشن شود (بعدش دوباره ایندکس کنید تا توکن‌ها ذخیره شوند).
+        "retrieval": {
+            "strategy": "single",            # یا "late_interaction"
+            "candidates": 100,
+            "token_dtype": "int8",           # int8 / float16 / float32
+            "token_pool_factor": 2           # میانگین هر ۲ توکن (۱ = بدون کاهش)
+        },
+        # بردارهای بزرگ: برای کالکشن‌های خیلی بزرگ IVF_PQ یا DISKANN هم قابل انتخاب است
+        "index": {"type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+        "storage": "float32",
+        "precision": "fp32"
     }
-}
\ No newline at end of file
+}
+
+
+def __getattr__(name):
+    # config.DEVICE به صورت lazy؛ فقط صفحاتی که مدل اجرا می‌کنند torch را import می‌کنند
+    if name == "DEVICE":
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        globals()["DEVICE"] = device
+        return device
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
@@ -1,154 +1,468 @@
 # core/ai_engine.py
-import streamlit as st
-from transformers import (
-    AutoProcessor, SiglipModel, AutoModel, 
-    BlipProcessor, BlipForConditionalGeneration,
-    CLIPModel, CLIPProcessor
-)
+# transformers / open_clip فقط وقتی مدلی از همان نوع لود شود import می‌شوند (شروع سریع صفحات)
 from PIL import Image
-import torch
+import atexit
+import threading
+import numpy as np
 import config
-# کتابخانه برای CLIPA
-import open_clip 
+from core.embedding_cache import EmbeddingCache, content_hash, read_with_hash
+from core.lru_cache import LRUCache
+from core.model_registry import ModelRegistry
+from core.late_interaction import pool_tokens
+from core.precision import resolve_precision, apply_precision, inference_context, torch_dtype, OnnxImageEncoder
+from core.token_store import TokenStore
+from core.lazy_import import LazyModule
+
+torch = LazyModule("torch")
 
 class AIEngine:
-    
+
+    # کش‌های دیسکی امبدینگ، یکی برای هر model_id (بین rerun ها مشترک)
+    _embedding_caches = {}
+    _embedding_caches_lock = threading.Lock()
+
+    _token_stores = {}
+
+    # کش LRU امبدینگ کوئری‌ها: (model_key, نوع، متن یا هش عکس) -> بردار
+    query_cache = LRUCache(config.QUERY_CACHE_SIZE, config.QUERY_CACHE_TTL)
+
+    # مدل‌های لودشده با سقف حافظه و حذف LRU (به جای st.cache_resource بی‌سقف)
+    _preloads = set()
+    models = ModelRegistry(config.MODEL_MEMORY_BUDGET_GB * 2**30 if config.MODEL_MEMORY_BUDGET_GB else None)
+
     @staticmethod
-    @st.cache_resource
-    def load_embedding_model(model_key):
+    def _registry_key(model_key, precision=None):
+        # پیش‌فرض همان دقت تنظیم‌شده؛ وگرنه یک نسخه اضافه fp32 هم لود می‌شود
+        precision = precision or resolve_precision(model_key)
+        # ONNX فقط انکودر تصویر است؛ پردازشگر و متن از مدل fp32
+        return model_key, "fp32" if precision == "onnx" else precision
+
+    @staticmethod
+    def load_embedding_model(model_key, precision=None):
+        key = AIEngine._registry_key(model_key, precision)
+        return AIEngine.models.get(key, lambda: AIEngine._load_embedding_model(*key))
+
+    @classmethod
+    def is_loaded(cls, model_key):
+        """Whether ``model_key`` (at its configured precision) is resident in memory."""
+        return cls._registry_key(model_key) in cls.models
+
+    @classmethod
+    def preload(cls, model_key=None):
+        """Load ``model_key`` (default ``config.PRELOAD_MODEL``) on a background thread, once per process."""
+        model_key = model_key or config.PRELOAD_MODEL
+        if not model_key or model_key in cls._preloads: return None
+        cls._preloads.add(model_key)
+        # حتی import torch هم داخل thread انجام می‌شود تا اولین رندر صفحه منتظر نماند
+        thread = threading.Thread(target=cls._preload, args=(model_key,), name=f"preload-{model_key}", daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def _preload(cls, model_key):
+        try:
+            cls()._unpack(model_key)
+        except Exception as e:
+            print(f"⚠️ Background preload of {model_key} failed: {e}")
+
+    @staticmethod
+    def _load_embedding_model(model_key, precision):
         cfg = config.MODELS_CONFIG[model_key]
-        print(f"🔄 Loading {model_key} ({cfg['model_id']}) on {config.DEVICE}...")
+        print(f"🔄 Loading {model_key} ({cfg['model_id']}) on {config.DEVICE} [{precision}]...")
         
         # 1. SigLIP
         if cfg["type"] == "siglip":
+            from transformers import AutoProcessor, SiglipModel
             model = SiglipModel.from_pretrained(cfg["model_id"]).to(config.DEVICE)
             processor = AutoProcessor.from_pretrained(cfg["model_id"])
-            return model, processor, "siglip"
+            return apply_precision(model.eval(), precision), processor, "siglip"
             
         # 2. Jina CLIP
         elif cfg["type"] == "jina":
+            from transformers import AutoModel
             model = AutoModel.from_pretrained(cfg["model_id"], trust_remote_code=True).to(config.DEVICE)
-            return model, None, "jina"
+            return apply_precision(model.eval(), precision), None, "jina"
             
         # 3. OpenCLIP (CLIPA)
         elif cfg["type"] == "open_clip":
+            # کتابخانه برای CLIPA
+            import open_clip
             model, _, preprocess = open_clip.create_model_and_transforms(cfg["model_id"], device=config.DEVICE)
             tokenizer = open_clip.get_tokenizer(cfg["model_id"])
-            return model, (preprocess, tokenizer), "open_clip"
+            return apply_precision(model.eval(), precision), (preprocess, tokenizer), "open_clip"
             
         # 4. Llama Nemo (Multimodal) 👇
         elif cfg["type"] == "llama_nemo":
-            # این مدل سنگین است (3B)، اگر GPU دارید بهتر است با float16 لود شود
-            dtype = torch.float16 if config.DEVICE == "cuda" else torch.float32
+            from transformers import AutoModel
+            # این مدل سنگین است (3B)؛ dtype از "precision" کانفیگ می‌آید (fp32 پیش‌فرض، bf16 روی CPU)
             model = AutoModel.from_pretrained(
                 cfg["model_id"], 
                 trust_remote_code=True, 
-                torch_dtype=torch.float32  # 👈 این خط مشکل را حل می‌کند
-                # torch_dtype=dtype
+                torch_dtype=torch_dtype(precision)
             ).to(config.DEVICE)
+            if precision == "int8_dynamic":
+                model = apply_precision(model, precision)
             # این مدل خودش پروسسور داخلی دارد
-            return model, None, "llama_nemo"
+            return model.eval(), None, "llama_nemo"
 
-    def get_embedding(self, model_key, image=None, text=None):
-        loaded_data = self.load_embedding_model(model_key)
+    @staticmethod
+    def load_onnx_encoder(model_key):
+        return AIEngine.models.get((model_key, "onnx"), lambda: AIEngine._load_onnx_encoder(model_key))
+
+    @staticmethod
+    def _load_onnx_encoder(model_key):
+        # export یک‌باره از مدل fp32 با یک عکس خالی برای شکل ورودی
+        model, processor, model_type = AIEngine.load_embedding_model(model_key, "fp32")
+        sample = AIEngine().prepare_image_batch(model_key, [Image.new("RGB", (224, 224))], precision="fp32")
+        if model_type == "siglip": sample = sample["pixel_values"]
+        return OnnxImageEncoder(model_key, model, model_type, sample)
+
+    @staticmethod
+    def _load_image(image):
+        # ورودی می‌تواند مسیر فایل یا شیء PIL باشد
+        if isinstance(image, str):
+            return Image.open(image).convert("RGB")
+        return image.convert("RGB")
+
+    @staticmethod
+    def precision(model_key):
+        """Effective inference precision for this model (``"precision"`` in config)."""
+        return resolve_precision(model_key)
+
+    def _unpack(self, model_key, precision=None):
+        loaded_data = self.load_embedding_model(model_key, precision)
         
         if len(loaded_data) == 3:
-            model, processor, model_type = loaded_data
-        else:
-            model, processor, model_type = loaded_data[0], None, "jina"
+            return loaded_data
+        return loaded_data[0], None, "jina"
 
-        vector = None
-        
-        with torch.no_grad():
-            
-            # --- منطق Llama Nemo (Multimodal) 👇 ---
-            if model_type == "llama_nemo":
-                embeddings = None
-                
-                if image:
-                    # لود کردن تصویر
-                    if isinstance(image, str): 
-                        pil_image = Image.open(image).convert("RGB")
-                    else: 
-                        pil_image = image.convert("RGB")
-                    
-                    # این مدل متد اختصاصی forward_passages دارد که عکس می‌گیرد
-                    # خروجی: [batch, num_tokens, dim]
-                    output = model.forward_passages([pil_image], batch_size=1)
-                    embeddings = output
-                    
-                elif text:
-                    # این مدل متد اختصاصی forward_queries دارد برای متن
-                    output = model.forward_queries([text], batch_size=1)
-                    embeddings = output
-
-                # تبدیل به تک‌بردار (Mean Pooling)
-                # چون خروجی ColBERT چند برداری است، برای Milvus باید میانگین بگیریم
-                if embeddings is not None:
-                    # embeddings shape: [1, seq_len, 3072]
-                    pooled = embeddings.mean(dim=1) # میانگین روی توکن‌ها
-                    
-                    # نرمال‌سازی (L2 Norm)
-                    pooled = pooled / pooled.norm(p=2, dim=-1, keepdim=True)
-                    
-                    # تبدیل به float32 (اگر مدل fp16 باشد، نامپای باید 32 باشد)
-                    vector = pooled[0].float().cpu().numpy()
+    def _empty(self, model_key):
+        return np.empty((0, config.MODELS_CONFIG[model_key]["dimension"]), dtype=np.float32)
+
+    @staticmethod
+    def _to_numpy(features):
+        # تبدیل به float32 (اگر مدل fp16 باشد، نامپای باید 32 باشد)
+        if isinstance(features, torch.Tensor): features = features.float().cpu().numpy()
+        vectors = np.asarray(features, dtype=np.float32)
+        if vectors.ndim == 1: vectors = vectors[None, :]
+        return vectors
+
+    @staticmethod
+    def _mean_pool(embeddings):
+        # Mean Pooling فقط روی توکن‌های واقعی (ردیف‌های پد صفر هستند)
+        # embeddings shape: [batch, seq_len, 3072]
+        mask = (embeddings.abs().sum(dim=-1, keepdim=True) > 0).to(embeddings.dtype)
+        pooled = (embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return pooled / pooled.norm(p=2, dim=-1, keepdim=True)
+
+    def prepare_image_batch(self, model_key, images, precision=None):
+        """CPU-side decode + preprocess of a batch; safe to run on worker threads.
+
+        The result is only meant to be passed to ``embed_image_batch``.
+        """
+        _, processor, model_type = self._unpack(model_key, precision)
+        pil_images = [self._load_image(img) for img in images]
+
+        if model_type == "siglip":
+            return processor(images=pil_images, return_tensors="pt")
+        elif model_type == "open_clip":
+            preprocess, _ = processor
+            return torch.stack([preprocess(img) for img in pil_images])
+        # Jina و Nemo پیش‌پردازش را داخل خود مدل انجام می‌دهند
+        return pil_images
+
+    def embed_image_batch(self, model_key, batch, precision=None):
+        """Run the model on the output of ``prepare_image_batch`` -> (N, dim) float32."""
+        precision = precision or self.precision(model_key)
+        model, _, model_type = self._unpack(model_key, precision)
+
+        with torch.no_grad(), inference_context(precision):
+            # --- ONNX Runtime (SigLIP / CLIPA) ---
+            if precision == "onnx":
+                encoder = self.load_onnx_encoder(model_key)
+                features = encoder(batch["pixel_values"] if model_type == "siglip" else batch)
+
+            # --- منطق Llama Nemo (Multimodal) ---
+            elif model_type == "llama_nemo":
+                # خروجی: [batch, num_tokens, dim]
+                embeddings = model.forward_passages(batch, batch_size=len(batch))
+                features = self._mean_pool(embeddings)
 
             # --- منطق SigLIP ---
             elif model_type == "siglip":
-                if image:
-                    if isinstance(image, str): image = Image.open(image).convert("RGB")
-                    inputs = processor(images=image, return_tensors="pt").to(config.DEVICE)
-                    features = model.get_image_features(**inputs)
-                elif text:
-                    inputs = processor(text=[text], return_tensors="pt", padding="max_length", max_length=64).to(config.DEVICE)
-                    features = model.get_text_features(**inputs)
-                
+                features = model.get_image_features(**batch.to(config.DEVICE))
                 features = features / features.norm(p=2, dim=-1, keepdim=True)
-                vector = features[0].cpu().numpy()
 
             # --- منطق Jina CLIP ---
             elif model_type == "jina":
-                if image:
-                    if isinstance(image, str): image = Image.open(image).convert("RGB")
-                    vector = model.encode_image(image) 
-                elif text:
-                    vector = model.encode_text(text)
-                
-                if isinstance(vector, torch.Tensor): vector = vector.cpu().numpy()
-                if vector.ndim > 1: vector = vector[0]
+                features = model.encode_image(batch, batch_size=len(batch))
 
             # --- منطق OpenCLIP (CLIPA) ---
             elif model_type == "open_clip":
-                preprocess, tokenizer = processor
-                if image:
-                    if isinstance(image, str): image = Image.open(image).convert("RGB")
-                    image_tensor = preprocess(image).unsqueeze(0).to(config.DEVICE)
-                    features = model.encode_image(image_tensor)
-                elif text:
-                    text_tokens = tokenizer([text]).to(config.DEVICE)
-                    features = model.encode_text(text_tokens)
-                
+                features = model.encode_image(batch.to(config.DEVICE))
+                features = features / features.norm(p=2, dim=-1, keepdim=True)
+
+        return self._to_numpy(features)
+
+    def _split_tokens(self, model_key, embeddings):
+        # [batch, seq_len, dim] پدشده -> لیست ماتریس‌های توکن واقعی هر آیتم
+        factor = self.retrieval_config(model_key)["token_pool_factor"]
+        embeddings = embeddings.float()
+        mask = embeddings.abs().sum(dim=-1) > 0
+        tokens = []
+        for i in range(len(embeddings)):
+            t = embeddings[i][mask[i]]
+            t = t / t.norm(p=2, dim=-1, keepdim=True).clamp(min=1e-12)
+            tokens.append(pool_tokens(t.cpu().numpy(), factor))
+        return tokens
+
+    def embed_image_batch_tokens(self, model_key, batch):
+        """Late-interaction models only: ``(pooled (N, dim), [per-item token matrices])``."""
+        model, _, model_type = self._unpack(model_key)
+        if model_type != "llama_nemo":
+            raise ValueError(f"{model_key} does not produce per-token embeddings")
+        with torch.no_grad(), inference_context(self.precision(model_key)):
+            embeddings = model.forward_passages(batch, batch_size=len(batch))
+            pooled = self._mean_pool(embeddings)
+        return self._to_numpy(pooled), self._split_tokens(model_key, embeddings)
+
+    def get_query_tokens(self, model_key, image=None, text=None):
+        """Per-token query embedding for MaxSim re-ranking (LRU-cached)."""
+        model, _, model_type = self._unpack(model_key)
+        if model_type != "llama_nemo":
+            raise ValueError(f"{model_key} does not produce per-token embeddings")
+        key = (model_key, "tokens", content_hash(image) if image is not None else text)
+        tokens = self.query_cache.get(key)
+        if tokens is None:
+            with torch.no_grad(), inference_context(self.precision(model_key)):
+                if image is not None:
+                    embeddings = model.forward_passages([self._load_image(image)], batch_size=1)
+                else:
+                    embeddings = model.forward_queries([text], batch_size=1)
+            # توکن‌های کوئری کاهش داده نمی‌شوند
+            embeddings = embeddings.float()[0]
+            embeddings = embeddings[embeddings.abs().sum(dim=-1) > 0]
+            tokens = (embeddings / embeddings.norm(p=2, dim=-1, keepdim=True).clamp(min=1e-12)).cpu().numpy()
+            tokens.setflags(write=False)
+            self.query_cache.put(key, tokens)
+        return tokens
+
+    def embed_text_batch(self, model_key, texts, precision=None):
+        """Embed a list of query strings -> (N, dim) float32."""
+        precision = precision or self.precision(model_key)
+        model, processor, model_type = self._unpack(model_key, precision)
+
+        with torch.no_grad(), inference_context(precision):
+            if model_type == "llama_nemo":
+                embeddings = model.forward_queries(texts, batch_size=len(texts))
+                features = self._mean_pool(embeddings)
+
+            elif model_type == "siglip":
+                inputs = processor(text=texts, return_tensors="pt", padding="max_length", max_length=64).to(config.DEVICE)
+                features = model.get_text_features(**inputs)
+                features = features / features.norm(p=2, dim=-1, keepdim=True)
+
+            elif model_type == "jina":
+                features = model.encode_text(texts, batch_size=len(texts))
+
+            elif model_type == "open_clip":
+                _, tokenizer = processor
+                features = model.encode_text(tokenizer(texts).to(config.DEVICE))
                 features = features / features.norm(p=2, dim=-1, keepdim=True)
-                vector = features[0].cpu().numpy()
 
+        return self._to_numpy(features)
+
+    @classmethod
+    def embedding_cache(cls, model_key):
+        """On-disk embedding cache for this model, or None if disabled."""
+        if not config.EMBED_CACHE_ENABLED: return None
+        model_id = config.MODELS_CONFIG[model_key]["model_id"]
+        with cls._embedding_caches_lock:
+            cache = cls._embedding_caches.get(model_id)
+            if cache is None:
+                cache = EmbeddingCache(model_id)
+                cls._embedding_caches[model_id] = cache
+        return cache
+
+    @staticmethod
+    def retrieval_config(model_key):
+        retrieval = {"strategy": "single", "candidates": 100, "token_dtype": "int8", "token_pool_factor": 1}
+        retrieval.update(config.MODELS_CONFIG[model_key].get("retrieval", {}))
+        return retrieval
+
+    @classmethod
+    def token_store(cls, model_key):
+        """TokenStore for late-interaction models, None for single-vector ones."""
+        retrieval = cls.retrieval_config(model_key)
+        if retrieval["strategy"] != "late_interaction": return None
+        # تنظیمات کاهش/کوانتیزه در نام ذخیره‌گاه می‌آید تا قاطی نشوند
+        name = f"{config.MODELS_CONFIG[model_key]['model_id']}__{retrieval['token_dtype']}_p{retrieval['token_pool_factor']}"
+        with cls._embedding_caches_lock:
+            store = cls._token_stores.get(name)
+            if store is None:
+                store = TokenStore(name, dtype=retrieval["token_dtype"])
+                cls._token_stores[name] = store
+        return store
+
+    @classmethod
+    def flush_embedding_caches(cls):
+        with cls._embedding_caches_lock:
+            for cache in cls._embedding_caches.values():
+                cache.flush()
+            for store in cls._token_stores.values():
+                store.flush()
+
+    def cached_vectors(self, model_key, hashes):
+        """Usable embedding-cache hits for ``hashes`` (content hash -> vector)."""
+        cache = self.embedding_cache(model_key)
+        found = cache.get_many(hashes) if cache is not None else {}
+        store = self.token_store(model_key)
+        if store is not None:
+            # برای مدل‌های late interaction توکن‌ها هم باید موجود باشند
+            found = {h: v for h, v in found.items() if h in store}
+        return found
+
+    def embed_missing(self, model_key, paths, hashes, found, missing, batch):
+        """Embed ``batch`` (the ``missing`` positions), merge with ``found`` hits and write the caches.
+
+        Shared by ``get_embeddings`` and ``IngestPipeline``; returns float32
+        (N, dim) in ``paths`` order.
+        """
+        vectors = [found.get(h) for h in hashes]
+        if missing:
+            store = self.token_store(model_key)
+            if store is not None:
+                fresh, tokens = self.embed_image_batch_tokens(model_key, batch)
+                store.put_many([hashes[i] for i in missing], tokens, [paths[i] for i in missing])
+            else:
+                fresh = self.embed_image_batch(model_key, batch)
+            for j, i in enumerate(missing):
+                vectors[i] = fresh[j]
+        vectors = np.stack(vectors).astype(np.float32)
+        cache = self.embedding_cache(model_key)
+        if cache is not None:
+            cache.put_many(hashes, vectors, list(paths))
+        return vectors
+
+    def _embed_paths_cached(self, model_key, paths):
+        # هر فایل یک بار خوانده می‌شود: هم برای هش، هم برای PIL
+        hashes, buffers = zip(*(read_with_hash(p) for p in paths))
+        found = self.cached_vectors(model_key, hashes)
+        missing = [i for i, h in enumerate(hashes) if h not in found]
+        batch = self.prepare_image_batch(model_key, [Image.open(buffers[i]) for i in missing]) if missing else None
+        return self.embed_missing(model_key, paths, hashes, found, missing, batch)
+
+    def get_embeddings(self, model_key, images=None, texts=None):
+        """Embed a batch of images (paths or PIL) or texts in one forward pass.
+
+        Image paths are looked up in the on-disk embedding cache first.
+        Returns a float32 array of shape (N, dim) with L2-normalised rows.
+        """
+        if images is not None:
+            images = list(images)
+            if not images: return self._empty(model_key)
+            cache = self.embedding_cache(model_key)
+            if cache is not None and all(isinstance(img, str) for img in images):
+                return self._embed_paths_cached(model_key, images)
+            return self.embed_image_batch(model_key, self.prepare_image_batch(model_key, images))
+        elif texts is not None:
+            texts = list(texts)
+            if not texts: return self._empty(model_key)
+            return self.embed_text_batch(model_key, texts)
+        raise ValueError("get_embeddings needs either images or texts")
+
+    def get_embedding(self, model_key, image=None, text=None):
+        # نسخه تکی؛ همان مسیر بچ با اندازه ۱، با کش LRU برای rerun های Streamlit
+        if image is not None:
+            key = (model_key, "image", content_hash(image))
+        elif text:
+            key = (model_key, "text", text)
+        else:
+            return None
+
+        vector = self.query_cache.get(key)
+        if vector is None:
+            if image is not None:
+                vector = self.get_embeddings(model_key, images=[image])[0]
+            else:
+                vector = self.get_embeddings(model_key, texts=[text])[0]
+            vector.setflags(write=False)  # بردار کش‌شده بین rerun ها مشترک است
+            self.query_cache.put(key, vector)
         return vector
 
+    @classmethod
+    def query_cache_stats(cls):
+        return cls.query_cache.stats()
+
+    @classmethod
+    def model_memory_stats(cls):
+        """Resident models (one row each) plus total / budget in MB."""
+        budget = cls.models.budget_bytes
+        return cls.models.stats(), {
+            "resident_mb": round(cls.models.resident_bytes() / 2**20, 1),
+            "budget_mb": round(budget / 2**20, 1) if budget else None,
+            "evictions": cls.models.evictions,
+        }
+
     # --- BLIP (Caption) ---
     @staticmethod
-    @st.cache_resource
     def load_caption_model():
+        return AIEngine.models.get(("BLIP", config.CAPTION_MODEL), AIEngine._load_caption_model)
+
+    @staticmethod
+    def _load_caption_model():
+        from transformers import BlipProcessor, BlipForConditionalGeneration
         processor = BlipProcessor.from_pretrained(config.CAPTION_MODEL)
         model = BlipForConditionalGeneration.from_pretrained(config.CAPTION_MODEL).to(config.DEVICE)
         return model, processor
 
-    def generate_caption(self, image_path):
+    @staticmethod
+    def _caption_batch(model, processor, images, max_new_tokens, num_beams):
+        # یک generate برای کل بچ؛ خروجی‌های کوتاه‌تر pad می‌شوند و batch_decode حذفشان می‌کند
+        inputs = processor(images=images, return_tensors="pt").to(config.DEVICE)
+        with torch.no_grad():
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, num_beams=num_beams, do_sample=False)
+        return [text.strip() for text in processor.batch_decode(out, skip_special_tokens=True)]
+
+    def generate_captions(self, images, max_new_tokens=None, num_beams=None):
+        """Caption a batch of images (paths or PIL) with one BLIP ``generate`` call.
+
+        ``num_beams=1`` is greedy decoding. Returns ``(captions, errors)``:
+        ``captions[i]`` is None where image i failed and ``errors`` lists
+        ``(image, message)`` for those items.
+        """
+        max_new_tokens = max_new_tokens or config.CAPTION_MAX_NEW_TOKENS
+        num_beams = num_beams or config.CAPTION_NUM_BEAMS
+        captions, errors, loaded = [None] * len(images), [], []
+        for i, image in enumerate(images):
+            try:
+                loaded.append((i, self._load_image(image)))
+            except Exception as e:
+                errors.append((image, f"cannot open image: {e}"))
+        if not loaded: return captions, errors
+
         model, processor = self.load_caption_model()
         try:
-            raw_image = Image.open(image_path).convert('RGB')
-            inputs = processor(raw_image, return_tensors="pt").to(config.DEVICE)
-            with torch.no_grad():
-                out = model.generate(**inputs, max_new_tokens=50)
-            return processor.decode(out[0], skip_special_tokens=True)
-        except Exception as e:
-            return "error in ai engine"
\ No newline at end of file
+            texts = self._caption_batch(model, processor, [img for _, img in loaded], max_new_tokens, num_beams)
+        except Exception:
+            # خطای بچ (مثلاً کمبود حافظه): تک‌تک تا فقط آیتم خراب خطا بگیرد
+            texts = []
+            for i, img in loaded:
+                try:
+                    texts.extend(self._caption_batch(model, processor, [img], max_new_tokens, num_beams))
+                except Exception as e:
+                    texts.append(None)
+                    errors.append((images[i], f"caption failed: {e}"))
+        for (i, _), text in zip(loaded, texts):
+            captions[i] = text
+        return captions, errors
+
+    def generate_caption(self, image_path, **kwargs):
+        """Single-image caption; raises ``RuntimeError`` with the reason on failure."""
+        captions, errors = self.generate_captions([image_path], **kwargs)
+        if errors: raise RuntimeError(errors[0][1])
+        return captions[0]
+
+
+# بافر کش‌ها هنگام خروج پروسه روی دیسک نوشته شود
+atexit.register(AIEngine.flush_embedding_caches)
@@ -0,0 +1,132 @@
+# core/caption_backfill.py
+import json
+import threading
+import time
+import config
+from core.text_index import CaptionIndex
+
+
+class CaptionBackfill:
+    """Fill in the ``caption`` of rows that were indexed without one.
+
+    Rows whose caption is in ``CAPTION_MISSING_VALUES`` are listed first (ids
+    only), then handled in batches: fetch, caption in one batched BLIP call,
+    upsert in place. Listing up front matters because an upsert into an auto_id
+    collection can give rows new ids, which a live iterator would meet again.
+    ``start()`` runs the job on a daemon thread; ``jobs`` keeps it reachable
+    across Streamlit reruns.
+    """
+
+    jobs = {}   # collection_name -> آخرین job (در حال اجرا یا تمام‌شده)
+    _jobs_lock = threading.Lock()
+
+    def __init__(self, ai, db, model_key, batch_size=None, max_new_tokens=None, num_beams=None, manifest=None):
+        self.ai = ai
+        self.db = db
+        self.model_key = model_key
+        self.collection_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        self.batch_size = batch_size or config.CAPTION_BATCH_SIZE
+        self.max_new_tokens = max_new_tokens
+        self.num_beams = num_beams
+        self.manifest = manifest
+        self.total = 0
+        self.done = 0
+        self.updated = 0
+        self.errors = []          # [(path, message)]
+        self.started_at = None
+        self.finished_at = None
+        self.failure = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def missing_filter():
+        return f"caption in {json.dumps(config.CAPTION_MISSING_VALUES)}"
+
+    def pending_ids(self):
+        ids = []
+        for batch in self.db.iter_collection(self.model_key, ("id",), filter_expr=self.missing_filter()):
+            ids.extend(int(i) for i in batch["id"])
+        return ids
+
+    def run(self, progress=None):
+        """Caption every pending row; ``progress(job)`` is called after each batch."""
+        self.started_at = time.time()
+        try:
+            ids = self.pending_ids()
+            self.total = len(ids)
+            for s in range(0, len(ids), self.batch_size):
+                if self._stop.is_set(): break
+                self._run_batch(ids[s : s + self.batch_size])
+                if progress: progress(self)
+        except Exception as e:
+            self.failure = e
+            raise
+        finally:
+            self.finished_at = time.time()
+        return self.updated
+
+    def _run_batch(self, ids):
+        fields = ("id", "vector", "path", "caption", "ingested_at")
+        rows = {f: [] for f in fields}
+        for batch in self.db.iter_collection(self.model_key, fields, filter_expr=f"id in {ids}"):
+            for f in fields:
+                rows[f].extend(batch[f])
+        captions, errors = self.ai.generate_captions(
+            rows["path"], max_new_tokens=self.max_new_tokens, num_beams=self.num_beams
+        )
+        self.errors.extend(errors)
+        self.done += len(ids)
+        # فقط ردیف‌هایی که کپشن گرفتند به‌روز می‌شوند؛ بقیه برای اجرای بعدی می‌مانند
+        keep = [i for i, c in enumerate(captions) if c]
+        if not keep: return
+        paths = [rows["path"][i] for i in keep]
+        new_ids = self.db.update_captions(
+            self.model_key,
+            [rows["id"][i] for i in keep],
+            [rows["vector"][i] for i in keep],
+            paths,
+            [captions[i] for i in keep],
+            [rows["ingested_at"][i] for i in keep],
+        )
+        if self.manifest is not None and new_ids != [int(rows["id"][i]) for i in keep]:
+            self.manifest.record(paths, new_ids)
+        self.updated += len(keep)
+        # متن کپشن‌ها عوض شد؛ ایندکس BM25 در جستجوی بعدی بازسازی می‌شود
+        CaptionIndex.invalidate(self.collection_name)
+
+    def start(self):
+        """Run in the background; returns False if a job for this collection is already running."""
+        with self._jobs_lock:
+            current = self.jobs.get(self.collection_name)
+            if current is not None and current.running: return False
+            self.jobs[self.collection_name] = self
+            self._thread = threading.Thread(target=self._run_quietly, name=f"caption-backfill-{self.collection_name}", daemon=True)
+            self._thread.start()
+        return True
+
+    def _run_quietly(self):
+        try:
+            self.run()
+        except Exception as e:
+            print(f"❌ Caption backfill of {self.collection_name} failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {
+            "running": self.running,
+            "done": self.done,
+            "total": self.total,
+            "updated": self.updated,
+            "errors": len(self.errors),
+            "elapsed_s": round(elapsed, 1),
+            "items_per_s": round(self.done / elapsed, 2) if elapsed else 0.0,
+            "failure": str(self.failure) if self.failure else None,
+        }
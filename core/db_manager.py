@@ -1,8 +1,38 @@
 # core/db_manager.py
 from pymilvus import MilvusClient, DataType
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import time
+import numpy as np
 import config
+from core.filters import METADATA_FIELDS, path_metadata
+from core.lru_cache import LRUCache
+from core.reduction import Reducer, stored_dimension
+
+# فرمت ذخیره بردار -> (نوع فیلد Milvus، متریک)
+# int8 به Milvus >= 2.6 نیاز دارد؛ binary با Hamming فقط برای فیلتر اولیه مناسب است
+STORAGE_FORMATS = {
+    "float32": (DataType.FLOAT_VECTOR, "COSINE"),
+    "float16": (DataType.FLOAT16_VECTOR, "COSINE"),
+    "int8": (getattr(DataType, "INT8_VECTOR", None), "COSINE"),
+    "binary": (DataType.BINARY_VECTOR, "HAMMING"),
+}
+# حجم هر بعد به بایت (برای گزارش حافظه)
+STORAGE_BYTES_PER_DIM = {"float32": 4, "float16": 2, "int8": 1, "binary": 1 / 8}
 
 class DBManager:
+
+    # کش نتایج جستجو (مشترک بین rerun ها): (کالکشن، هش بردار، فیلتر، k) -> hits
+    result_cache = LRUCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL)
+    # نوع ایندکس ساخته‌شده روی هر کالکشن (از describe_index)
+    _index_types = {}
+    # فرمت واقعی فیلد vector روی هر کالکشن (از describe_collection)
+    _storage_formats = {}
+    # مرحله کاهش ابعاد هر مدل (PCA / Matryoshka)
+    _reducers = {}
+    # آیا کالکشن فیلدهای اسکالر filename/directory/... را در schema دارد
+    _metadata_fields = {}
+
     def __init__(self):
         try:
             self.client = MilvusClient(uri=config.MILVUS_URI)
@@ -12,69 +42,527 @@ class DBManager:
     def ensure_collection(self, model_key):
         cfg = config.MODELS_CONFIG[model_key]
         col_name = cfg["collection_name"]
-        dim = cfg["dimension"]
+        dim = stored_dimension(model_key)
 
         if not self.client.has_collection(col_name):
-            print(f"🆕 Creating collection '{col_name}' with dim={dim}...")
-            
-            schema = MilvusClient.create_schema(auto_id=True, enable_dynamic_field=True)
-            schema.add_field("id", DataType.INT64, is_primary=True)
-            schema.add_field("vector", DataType.FLOAT_VECTOR, dim=dim)
-            schema.add_field("path", DataType.VARCHAR, max_length=1024)
-            schema.add_field("caption", DataType.VARCHAR, max_length=2048)
-
-            index_params = self.client.prepare_index_params()
-            index_params.add_index(
-                field_name="vector", 
-                index_type="HNSW", 
-                metric_type="COSINE", 
-                params={"M": 16, "efConstruction": 200}
-            )
-
-            self.client.create_collection(
-                collection_name=col_name,
-                schema=schema,
-                index_params=index_params
-            )
+            index_type, build_params = self.index_config(model_key)
+            self._create_collection(col_name, dim, self.storage_format(model_key), index_type, build_params)
         return col_name
 
+    def _create_collection(self, col_name, dim, fmt, index_type, build_params):
+        field_type, metric = STORAGE_FORMATS[fmt]
+        if field_type is None:
+            raise ValueError(f"Storage format '{fmt}' needs a newer pymilvus/Milvus")
+        print(f"🆕 Creating collection '{col_name}' with dim={dim} ({fmt})...")
+        
+        schema = MilvusClient.create_schema(auto_id=True, enable_dynamic_field=True)
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field("vector", field_type, dim=dim)
+        schema.add_field("path", DataType.VARCHAR, max_length=1024)
+        schema.add_field("caption", DataType.VARCHAR, max_length=2048)
+        # فیلدهای مشتق از مسیر برای فیلتر ایندکس‌شده (به جای path like '%..%')
+        schema.add_field("filename", DataType.VARCHAR, max_length=512)
+        schema.add_field("directory", DataType.VARCHAR, max_length=1024)
+        schema.add_field("extension", DataType.VARCHAR, max_length=16)
+        schema.add_field("ingested_at", DataType.INT64)
+
+        print(f"🧱 Index: {index_type} {build_params}")
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector", 
+            index_type=index_type, 
+            metric_type=metric, 
+            params=build_params
+        )
+        # INVERTED برای تساوی / in / پیشوند روی رشته‌ها، STL_SORT برای بازه تاریخ
+        for field in ("filename", "directory", "extension"):
+            index_params.add_index(field_name=field, index_type="INVERTED")
+        index_params.add_index(field_name="ingested_at", index_type="STL_SORT")
+
+        self.client.create_collection(
+            collection_name=col_name,
+            schema=schema,
+            index_params=index_params
+        )
+        self._index_types[col_name] = index_type
+        self._storage_formats[col_name] = fmt
+        self._metadata_fields[col_name] = True
+
+    @staticmethod
+    def storage_format(model_key):
+        return config.MODELS_CONFIG[model_key].get("storage", "float32")
+
+    def live_storage_format(self, model_key):
+        # فرمتی که کالکشن موجود واقعاً با آن ساخته شده (ممکن است با کانفیگ فرق کند)
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if col_name in self._storage_formats: return self._storage_formats[col_name]
+        try:
+            if self.client.has_collection(col_name):
+                fields = self.client.describe_collection(col_name)["fields"]
+                vector_type = next(f["type"] for f in fields if f["name"] == "vector")
+                for fmt, (field_type, _) in STORAGE_FORMATS.items():
+                    if field_type is not None and vector_type == field_type:
+                        self._storage_formats[col_name] = fmt
+                        return fmt
+        except Exception as e:
+            print(f"⚠️ describe_collection failed for '{col_name}': {e}")
+        return self.storage_format(model_key)
+
+    def has_metadata_fields(self, model_key):
+        """True if the collection schema has the indexed path-metadata fields.
+
+        Older collections still get them as dynamic fields on new rows, but
+        those are neither indexed nor present on old rows; filter with
+        ``build_filter(indexed=False)`` there or migrate the collection.
+        """
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if col_name in self._metadata_fields: return self._metadata_fields[col_name]
+        try:
+            if not self.client.has_collection(col_name): return True  # با schema جدید ساخته می‌شود
+            names = {f["name"] for f in self.client.describe_collection(col_name)["fields"]}
+            self._metadata_fields[col_name] = all(f in names for f in METADATA_FIELDS)
+        except Exception as e:
+            print(f"⚠️ describe_collection failed for '{col_name}': {e}")
+            return False
+        return self._metadata_fields[col_name]
+
+    @staticmethod
+    def _rows(vectors, paths, captions, ingested_at=None):
+        # یک ردیف کامل: بردار، مسیر، کپشن و فیلدهای مشتق از مسیر
+        now = time.time()
+        if ingested_at is None: ingested_at = [None] * len(paths)
+        return [
+            {"vector": vec, "path": path, "caption": cap or "", **path_metadata(path, ts if ts is not None else now)}
+            for vec, path, cap, ts in zip(vectors, paths, captions, ingested_at)
+        ]
+
+    @staticmethod
+    def encode_vectors(fmt, vectors):
+        """float32 (n, dim) -> list of values in the Milvus wire format for ``fmt``."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1: vectors = vectors[None, :]
+        if fmt == "float16":
+            return list(vectors.astype(np.float16))
+        if fmt == "int8":
+            # بردارها نرمال هستند؛ مقیاس ثابت 127 جهت را حفظ می‌کند
+            return list(np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8))
+        if fmt == "binary":
+            # بیت علامت هر بعد (SimHash)
+            return [bytes(row) for row in np.packbits(vectors > 0, axis=1)]
+        return list(vectors)
+
+    @staticmethod
+    def decode_vectors(fmt, values, dim):
+        """Milvus query output for ``fmt`` -> float32 (n, dim), L2-normalised for lossy formats."""
+        if fmt == "float32":
+            return np.asarray(values, dtype=np.float32).reshape(-1, dim)
+
+        def raw(v):
+            # pymilvus بردارهای باینری/float16 را گاهی به صورت [bytes] برمی‌گرداند
+            if isinstance(v, (list, tuple)) and len(v) == 1 and isinstance(v[0], (bytes, bytearray)): v = v[0]
+            return v
+
+        if fmt == "binary":
+            bits = np.unpackbits(np.stack([np.frombuffer(raw(v), dtype=np.uint8) for v in values]), axis=1)[:, :dim]
+            out = bits.astype(np.float32) * 2 - 1
+        elif fmt == "float16":
+            out = np.stack([np.frombuffer(raw(v), dtype=np.float16) if isinstance(raw(v), (bytes, bytearray))
+                            else np.asarray(raw(v), dtype=np.float16) for v in values]).astype(np.float32)
+        else:
+            out = np.stack([np.frombuffer(raw(v), dtype=np.int8) if isinstance(raw(v), (bytes, bytearray))
+                            else np.asarray(raw(v), dtype=np.int8) for v in values]).astype(np.float32)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+    @classmethod
+    def reducer(cls, model_key):
+        if model_key not in cls._reducers:
+            cls._reducers[model_key] = Reducer(model_key)
+        return cls._reducers[model_key]
+
+    def prepare_vectors(self, model_key, vectors):
+        # همه بردارهای ورودی (اینسرت و کوئری) از همین مسیر رد می‌شوند: کاهش ابعاد، سپس فرمت ذخیره
+        vectors = self.reducer(model_key).transform(vectors)
+        return self.encode_vectors(self.live_storage_format(model_key), vectors)
+
+    @staticmethod
+    def hamming_to_cosine(distance, dim):
+        # تخمین SimHash: cos(θ) با θ = π · h / dim
+        return float(np.cos(np.pi * distance / dim))
+
+    @staticmethod
+    def cosine_to_hamming(similarity, dim):
+        return float(dim * np.arccos(np.clip(similarity, -1.0, 1.0)) / np.pi)
+
+    def _as_similarity(self, model_key, hits):
+        # برای باینری، فاصله Hamming به تخمین کسینوسی تبدیل می‌شود تا آستانه‌ها معنی داشته باشند
+        if self.live_storage_format(model_key) != "binary": return hits
+        dim = stored_dimension(model_key)
+        return [{**hit, "hamming": hit["distance"], "distance": self.hamming_to_cosine(hit["distance"], dim)}
+                for hit in hits]
+
+    @staticmethod
+    def index_config(model_key):
+        """(index_type, build_params) from MODELS_CONFIG, filled with defaults."""
+        index = config.MODELS_CONFIG[model_key].get("index", config.DEFAULT_INDEX)
+        index_type = index.get("type", "HNSW").upper()
+        params = dict(index.get("params", {}))
+        if DBManager.storage_format(model_key) == "binary" and not index_type.startswith("BIN_"):
+            # بردار باینری فقط ایندکس‌های BIN_* را می‌پذیرد
+            index_type, params = "BIN_IVF_FLAT", {}
+        return index_type, {**config.INDEX_BUILD_DEFAULTS.get(index_type, {}), **params}
+
+    def live_index_type(self, model_key):
+        # نوع ایندکسی که واقعاً روی کالکشن ساخته شده (ممکن است با کانفیگ فعلی فرق کند)
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if col_name in self._index_types: return self._index_types[col_name]
+
+        index_type = None
+        try:
+            if self.client.has_collection(col_name):
+                index_type = self.client.describe_index(col_name, "vector").get("index_type")
+        except Exception as e:
+            print(f"⚠️ describe_index failed for '{col_name}': {e}")
+        if not index_type:
+            return self.index_config(model_key)[0]
+        self._index_types[col_name] = index_type.upper()
+        return self._index_types[col_name]
+
+    def search_params(self, model_key, query_params=None, limit=None, **extra):
+        """Query-time params matching the collection's index (ef / nprobe / search_list)."""
+        index_type = self.live_index_type(model_key)
+        params = dict(config.INDEX_SEARCH_DEFAULTS.get(index_type, {}))
+        if query_params: params.update(query_params)
+        # HNSW: ef باید حداقل به اندازه تعداد نتایج خواسته‌شده باشد
+        if index_type == "HNSW" and limit:
+            params["ef"] = max(int(params.get("ef", limit)), limit)
+        params.update(extra)
+        metric = STORAGE_FORMATS[self.live_storage_format(model_key)][1]
+        return {"metric_type": metric, "params": params}
+
     def insert_image(self, model_key, vector, path, caption=""):
         col_name = self.ensure_collection(model_key)
-        data = [{"vector": vector, "path": path, "caption": caption}]
+        vector = self.prepare_vectors(model_key, vector)[0]
+        data = self._rows([vector], [path], [caption])
+        res = self.client.insert(col_name, data)
+        self.result_cache.clear()
+        return res
+
+    def insert_images(self, model_key, vectors, paths, captions=None):
+        # اینسرت یک بچ کامل در یک درخواست
+        col_name = self.ensure_collection(model_key)
+        if captions is None: captions = [""] * len(paths)
+        if not len(paths): return None
+        vectors = self.prepare_vectors(model_key, vectors)
+        data = self._rows(vectors, paths, captions)
+        if not data: return None
         res = self.client.insert(col_name, data)
+        self.result_cache.clear()
         return res
 
-    def search(self, model_key, vector, top_k=5, filter_expr=None):
+    def count(self, model_key):
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if not self.client.has_collection(col_name): return 0
+        res = self.client.query(collection_name=col_name, output_fields=["count(*)"])
+        return int(res[0]["count(*)"])
+
+    def filter_ids(self, model_key, ids, filter_expr):
+        """Subset of ``ids`` whose rows match ``filter_expr``."""
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if not len(ids): return set()
+        rows = self.client.query(collection_name=col_name, filter=f"id in {[int(i) for i in ids]} and ({filter_expr})",
+                                 output_fields=["id"])
+        return {int(row["id"]) for row in rows}
+
+    def update_captions(self, model_key, ids, vectors, paths, captions, ingested_at=None):
+        """Rewrite the caption of existing rows in place (upsert by primary key).
+
+        ``vectors`` are the decoded stored vectors from ``iter_collection``; they
+        are re-encoded as-is (no second reduction). ``ingested_at`` keeps the
+        original ingestion time. Returns the primary keys after the upsert,
+        since an auto_id collection may assign new ones.
+        """
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        vectors = self.encode_vectors(self.live_storage_format(model_key), vectors)
+        data = self._rows(vectors, paths, captions, ingested_at)
+        for row, row_id in zip(data, ids):
+            row["id"] = int(row_id)
+        if not data: return []
+        res = self.client.upsert(col_name, data)
+        self.result_cache.clear()
+        new_ids = (res.get("primary_keys") or res.get("ids")) if isinstance(res, dict) else None
+        return [int(i) for i in new_ids] if new_ids else [int(i) for i in ids]
+
+    def search(self, model_key, vector, top_k=5, filter_expr=None, query_params=None):
         cfg = config.MODELS_CONFIG[model_key]
         col_name = cfg["collection_name"]
         
         if not self.client.has_collection(col_name): return []
 
-        search_params = {"metric_type": "COSINE", "params": {"nprobe": 10}}
+        search_params = self.search_params(model_key, query_params, limit=top_k)
         res = self.client.search(
             collection_name=col_name,
-            data=[vector],
+            data=self.prepare_vectors(model_key, vector),
             limit=top_k,
             filter=filter_expr,
             output_fields=["path", "caption"],
             search_params=search_params
         )
-        return res[0]
+        return self._as_similarity(model_key, res[0])
 
-    def get_all_data(self, model_key, limit=10000):
+    # تعداد کوئری (nq) در هر درخواست search_many؛ پیام gRPC برای ابعاد 3072 هم چند مگابایت می‌ماند
+    SEARCH_BATCH_SIZE = 256
+
+    def search_many(self, model_key, vectors, top_k=5, filter_expr=None, query_params=None,
+                    batch_size=None, workers=1, progress=None):
+        """Search many queries at once; returns one hit list per row of ``vectors``, in order.
+
+        ``vectors`` is an (N, dim) array. Rows are sent ``batch_size`` at a time
+        as multi-vector search requests (one round trip per batch instead of per
+        query), with up to ``workers`` batches in flight. ``progress(done, total)``
+        counts finished queries and is called from the calling thread.
+        """
         col_name = config.MODELS_CONFIG[model_key]["collection_name"]
-        if not self.client.has_collection(col_name): return []
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1: vectors = vectors[None, :]
+        if not len(vectors) or not self.client.has_collection(col_name): return [[] for _ in range(len(vectors))]
+
+        batch_size = batch_size or self.SEARCH_BATCH_SIZE
+        search_params = self.search_params(model_key, query_params, limit=top_k)
+        data = self.prepare_vectors(model_key, vectors)
+        starts = range(0, len(data), batch_size)
+
+        def run(start):
+            return self.client.search(
+                collection_name=col_name,
+                data=data[start : start + batch_size],
+                limit=top_k,
+                filter=filter_expr,
+                output_fields=["path", "caption"],
+                search_params=search_params
+            )
+
+        results = [None] * len(data)
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(starts)))) as executor:
+            futures = {executor.submit(run, start): start for start in starts}
+            for future in as_completed(futures):
+                start = futures[future]
+                for i, hits in enumerate(future.result()):
+                    results[start + i] = self._as_similarity(model_key, list(hits))
+                done += min(batch_size, len(data) - start)
+                if progress: progress(done, len(data))
+        return results
+
+    # سقف Milvus برای limit + offset در یک جستجو
+    MAX_SEARCH_WINDOW = 16384
+
+    def range_search_page(self, model_key, vector, threshold, offset=0, page_size=100, filter_expr=None,
+                          query_params=None):
+        """One page of hits with ``threshold < score <= 1`` (COSINE), best first."""
+        cfg = config.MODELS_CONFIG[model_key]
+        col_name = cfg["collection_name"]
         
-        res = self.client.query(
+        if not self.client.has_collection(col_name): return []
+
+        fmt = self.live_storage_format(model_key)
+        if fmt == "binary":
+            # Hamming: کوچک‌تر بهتر است؛ radius حد بالای فاصله است
+            radius = self.cosine_to_hamming(threshold, stored_dimension(model_key))
+            search_params = self.search_params(model_key, query_params, limit=offset + page_size,
+                                               radius=radius, range_filter=0.0)
+        else:
+            # radius = حد پایین (انحصاری)، range_filter = حد بالا برای COSINE
+            search_params = self.search_params(model_key, query_params, limit=offset + page_size,
+                                               radius=float(threshold), range_filter=1.0)
+        res = self.client.search(
             collection_name=col_name,
-            filter="id >= 0",
-            output_fields=["vector", "path", "caption"],
-            limit=limit
+            data=self.prepare_vectors(model_key, vector),
+            limit=page_size,
+            offset=offset,
+            filter=filter_expr,
+            output_fields=["path", "caption"],
+            search_params=search_params
         )
-        return res
+        return self._as_similarity(model_key, res[0])
+
+    def range_search(self, model_key, vector, threshold, cap=1000, page_size=200, filter_expr=None,
+                     query_params=None):
+        """All hits above ``threshold`` up to ``cap``, fetched page by page on the server."""
+        cap = min(cap, self.MAX_SEARCH_WINDOW)
+        hits = []
+        while len(hits) < cap:
+            size = min(page_size, cap - len(hits))
+            page = list(self.range_search_page(model_key, vector, threshold, offset=len(hits),
+                                               page_size=size, filter_expr=filter_expr,
+                                               query_params=query_params))
+            hits.extend(page)
+            if len(page) < size: break
+        return hits
+
+    def range_search_cached(self, model_key, vector, threshold, cap=1000, filter_expr=None, query_params=None):
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        key = (col_name, self._vector_key(vector), filter_expr, "range", round(float(threshold), 4), cap,
+               self._params_key(query_params))
+        hits = self.result_cache.get(key)
+        if hits is None:
+            hits = self.range_search(model_key, vector, threshold, cap=cap, filter_expr=filter_expr,
+                                     query_params=query_params)
+            self.result_cache.put(key, hits)
+        return hits
+
+    @staticmethod
+    def _vector_key(vector):
+        return hashlib.blake2b(np.asarray(vector, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _params_key(query_params):
+        return tuple(sorted((query_params or {}).items()))
+
+    def search_cached(self, model_key, vector, top_k=5, filter_expr=None, threshold=None, query_params=None):
+        """Like ``search`` but over-fetches once and answers narrower
+        top_k / threshold requests from memory (no Milvus round trip)."""
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        fetch_k = max(top_k, config.RESULT_CACHE_FETCH_K)
+        key = (col_name, self._vector_key(vector), filter_expr, fetch_k, self._params_key(query_params))
+
+        hits = self.result_cache.get(key)
+        if hits is None:
+            hits = list(self.search(model_key, vector, top_k=fetch_k, filter_expr=filter_expr,
+                                    query_params=query_params))
+            self.result_cache.put(key, hits)
+
+        hits = hits[:top_k]
+        if threshold is not None:
+            hits = [h for h in hits if h['distance'] >= threshold]
+        return hits
+
+    def iter_collection(self, model_key, fields=("id", "vector", "path", "caption"), batch_size=2000,
+                        filter_expr="id >= 0", limit=None):
+        """Stream a whole collection in bounded batches (Milvus query iterator).
+
+        Each batch is a dict of NumPy arrays: ``id`` int64, ``vector`` (n, dim)
+        float32 (decoded from the stored format), other scalar fields as object
+        arrays. Memory stays at one batch.
+        """
+        col_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        if not self.client.has_collection(col_name): return
+
+        fields = list(fields)
+        fmt = self.live_storage_format(model_key)
+        dim = stored_dimension(model_key)
+        iterator = self.client.query_iterator(
+            collection_name=col_name,
+            batch_size=batch_size,
+            limit=limit if limit is not None else -1,
+            filter=filter_expr,
+            output_fields=[f for f in fields if f != "id"]
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows: break
+                batch = {}
+                for field in fields:
+                    values = [row.get(field) for row in rows]
+                    if field == "id":
+                        batch[field] = np.asarray(values, dtype=np.int64)
+                    elif field == "vector":
+                        batch[field] = self.decode_vectors(fmt, values, dim)
+                    else:
+                        batch[field] = np.asarray(values, dtype=object)
+                yield batch
+        finally:
+            iterator.close()
+
+    def load_collection_arrays(self, model_key, fields=("id", "vector", "path"), batch_size=2000, limit=None):
+        # کل کالکشن به صورت آرایه‌های فشرده (بدون لیست دیکشنری‌های پایتونی)
+        parts = {f: [] for f in fields}
+        for batch in self.iter_collection(model_key, fields, batch_size=batch_size, limit=limit):
+            for f in fields:
+                parts[f].append(batch[f])
+        return {f: np.concatenate(chunks) if chunks else np.empty(0) for f, chunks in parts.items()}
+
+    def migrate_collection(self, model_key, target_format, target_collection=None, index=None,
+                           batch_size=2000, progress=None):
+        """Copy a collection into a new one stored as ``target_format``.
+
+        Rows are streamed (decoded to float32, re-encoded) so memory stays flat.
+        The source collection is left untouched; point ``collection_name`` /
+        ``storage`` in MODELS_CONFIG at the new one once it checks out. The new
+        collection always has the indexed metadata fields, so migrating to the
+        same format upgrades an old collection.
+        """
+        cfg = config.MODELS_CONFIG[model_key]
+        target_collection = target_collection or f"{cfg['collection_name']}_{target_format}"
+        if self.client.has_collection(target_collection):
+            raise ValueError(f"Collection '{target_collection}' already exists")
+
+        index_type, build_params = index or self.index_config(model_key)
+        if target_format == "binary" and not index_type.startswith("BIN_"):
+            index_type, build_params = "BIN_IVF_FLAT", dict(config.INDEX_BUILD_DEFAULTS["BIN_IVF_FLAT"])
+        elif target_format != "binary" and index_type.startswith("BIN_"):
+            index_type, build_params = config.DEFAULT_INDEX["type"], dict(config.DEFAULT_INDEX["params"])
+        self._create_collection(target_collection, stored_dimension(model_key), target_format, index_type, build_params)
+
+        copied = 0
+        # ingested_at ردیف‌های قدیمی (اگر نباشد) زمان مهاجرت می‌شود
+        fields = ("id", "vector", "path", "caption", "ingested_at")
+        for batch in self.iter_collection(model_key, fields, batch_size=batch_size):
+            vectors = self.encode_vectors(target_format, batch["vector"])
+            data = self._rows(vectors, batch["path"], batch["caption"], batch["ingested_at"])
+            self.client.insert(target_collection, data)
+            copied += len(data)
+            if progress: progress(copied)
+        return target_collection, copied
+
+    def get_all_data(self, model_key, limit=10000):
+        # سازگاری با کد قدیمی؛ حالا از iterator استفاده می‌کند و به سقف 16384 محدود نیست
+        rows = []
+        for batch in self.iter_collection(model_key, limit=limit):
+            for i in range(len(batch["id"])):
+                rows.append({
+                    "id": int(batch["id"][i]),
+                    "vector": batch["vector"][i],
+                    "path": batch["path"][i],
+                    "caption": batch["caption"][i]
+                })
+        return rows
     
     def delete_by_ids(self, model_key, id_list):
-        if not id_list: return
+        if not len(id_list): return 0
+        report = self.bulk_delete(model_key, id_list, workers=1)
+        return sum(chunk["deleted"] for chunk in report)
+
+    def _delete_chunk(self, col_name, chunk):
+        # عبارت کوتاه با int های خالص (بدون numpy repr)
+        filter_expr = f"id in [{','.join(str(int(i)) for i in chunk)}]"
+        res = self.client.delete(collection_name=col_name, filter=filter_expr)
+        if isinstance(res, dict) and "delete_count" in res:
+            return int(res["delete_count"])
+        return len(chunk)
+
+    def bulk_delete(self, model_key, id_list, chunk_size=1000, workers=4, progress=None):
+        """Delete ``id_list`` in chunks of ``chunk_size``, ``workers`` chunks at a time.
+
+        Keeps every filter expression well under Milvus' expression limits.
+        Returns one ``{"chunk", "requested", "deleted", "error"}`` dict per chunk;
+        ``progress(done_chunks, total_chunks)`` is called from the calling thread.
+        """
         col_name = config.MODELS_CONFIG[model_key]["collection_name"]
-        filter_expr = f"id in {id_list}"
-        self.client.delete(collection_name=col_name, filter=filter_expr)
\ No newline at end of file
+        ids = list(dict.fromkeys(int(i) for i in id_list))
+        chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        report = [None] * len(chunks)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks) or 1))) as executor:
+            futures = {executor.submit(self._delete_chunk, col_name, chunk): n for n, chunk in enumerate(chunks)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                n = futures[future]
+                try:
+                    report[n] = {"chunk": n, "requested": len(chunks[n]), "deleted": future.result(), "error": None}
+                except Exception as e:
+                    print(f"❌ Delete chunk {n} failed: {e}")
+                    report[n] = {"chunk": n, "requested": len(chunks[n]), "deleted": 0, "error": str(e)}
+                if progress: progress(done, len(chunks))
+
+        self.result_cache.clear()
+        return report
\ No newline at end of file
@@ -0,0 +1,74 @@
+# core/dedup.py
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # ریشه همیشه اندیس کوچک‌تر است تا "اصلی" قدیمی‌ترین رکورد باشد
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def find_duplicate_clusters(vectors, threshold=0.99, block_size=2048, progress=None):
+    """Group rows whose cosine similarity is >= ``threshold``.
+
+    Works on ``block_size x block_size`` tiles of the upper triangle, so peak
+    memory is one tile of scores regardless of collection size. Returns a list
+    of clusters (lists of row indices, sorted, first = lowest index), only for
+    clusters with more than one member.
+    """
+    x = _normalize(vectors)
+    n = len(x)
+    uf = _UnionFind(n)
+    # خطای float: بردارهای یکسان ممکن است 0.9999999 شوند
+    cutoff = threshold - 1e-6
+
+    n_blocks = (n + block_size - 1) // block_size
+    total_tiles = n_blocks * (n_blocks + 1) // 2
+    done_tiles = 0
+    for bi in range(0, n, block_size):
+        xi = x[bi : bi + block_size]
+        for bj in range(bi, n, block_size):
+            scores = xi @ x[bj : bj + block_size].T
+            if bi == bj:
+                # فقط نیمه بالایی (بدون قطر) تا هر جفت یک بار شمرده شود
+                scores = np.triu(scores, k=1)
+            rows, cols = np.nonzero(scores >= cutoff)
+            for r, c in zip(rows + bi, cols + bj):
+                uf.union(r, c)
+            done_tiles += 1
+            if progress: progress(done_tiles / total_tiles)
+
+    roots = np.array([uf.find(i) for i in range(n)])
+    order = np.argsort(roots, kind="stable")
+    sorted_roots = roots[order]
+    splits = np.flatnonzero(np.diff(sorted_roots)) + 1
+    return [group.tolist() for group in np.split(order, splits) if len(group) > 1]
+
+
+def similarity_to_first(vectors, cluster):
+    """Cosine of every cluster member to the kept one (``cluster[0]``).
+
+    Clusters are transitive (A~B, B~C puts C with A even if A and C differ),
+    so callers should check each member against the original before acting.
+    """
+    x = _normalize(np.asarray(vectors)[cluster])
+    return x @ x[0]
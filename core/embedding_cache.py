@@ -0,0 +1,160 @@
+# core/embedding_cache.py
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import numpy as np
+import config
+
+
+def content_hash(source):
+    """blake2b of the raw file bytes (path, bytes or PIL image)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        # PIL: پیکسل‌ها + اندازه، چون بایت فایل اصلی در دسترس نیست
+        data = source.tobytes() + repr((source.mode, source.size)).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding store for one model, keyed by image content hash.
+
+    Layout under ``<root>/<model_id>/``::
+
+        shard_00000.npy   # (rows, dim) float16/float32, opened with mmap
+        index.jsonl       # {"h", "s", "r"} -> hash lives in shard s, row r
+                          # {"p", "h"}      -> file path p has content hash h
+
+    New vectors are buffered in memory and written as a new shard once
+    ``shard_size`` rows are pending (or on ``flush``).
+    """
+
+    def __init__(self, model_id, root=None, dtype=None, shard_size=4096):
+        self.model_id = model_id
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "__", model_id)
+        self.dir = os.path.join(root or config.EMBED_CACHE_DIR, safe_name)
+        self.index_path = os.path.join(self.dir, "index.jsonl")
+        self.dtype = np.dtype(dtype or config.EMBED_CACHE_DTYPE)
+        self.shard_size = shard_size
+
+        self.locations = {}   # hash -> (shard, row)
+        self.paths = {}       # path -> hash
+        self._shards = {}     # shard -> mmap array
+        self._pending = {}    # hash -> float32 vector
+        self._pending_paths = {}
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path): return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "s" in row:
+                    self.locations[row["h"]] = (row["s"], row["r"])
+                if "p" in row:
+                    self.paths[row["p"]] = row["h"]
+
+    def _shard_file(self, shard):
+        return os.path.join(self.dir, f"shard_{shard:05d}.npy")
+
+    def _shard(self, shard):
+        arr = self._shards.get(shard)
+        if arr is None:
+            arr = np.load(self._shard_file(shard), mmap_mode="r")
+            self._shards[shard] = arr
+        return arr
+
+    def __contains__(self, h):
+        return h in self._pending or h in self.locations
+
+    def __len__(self):
+        return len(self.locations) + len(self._pending)
+
+    def get_many(self, hashes):
+        """Return ``{hash: float32 vector}`` for the hashes that are cached."""
+        found = {}
+        with self._lock:
+            for h in hashes:
+                if h in self._pending:
+                    found[h] = self._pending[h]
+                elif h in self.locations:
+                    shard, row = self.locations[h]
+                    found[h] = np.asarray(self._shard(shard)[row], dtype=np.float32)
+        return found
+
+    def get_by_paths(self, paths):
+        """``{path: float32 vector}`` for paths whose last cached content is present (no file reads)."""
+        with self._lock:
+            hashes = {p: self._pending_paths.get(p) or self.paths.get(p) for p in paths}
+            found = self.get_many([h for h in hashes.values() if h])
+        return {p: found[h] for p, h in hashes.items() if h in found}
+
+    def put_many(self, hashes, vectors, paths=None):
+        with self._lock:
+            for i, h in enumerate(hashes):
+                if h not in self:
+                    self._pending[h] = np.asarray(vectors[i], dtype=np.float32)
+                if paths is not None and self.paths.get(paths[i]) != h:
+                    self._pending_paths[paths[i]] = h
+            if len(self._pending) >= self.shard_size:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._pending_paths: return
+            os.makedirs(self.dir, exist_ok=True)
+            lines = []
+            if self._pending:
+                shard = len(glob.glob(os.path.join(self.dir, "shard_*.npy")))
+                hashes = list(self._pending)
+                matrix = np.stack([self._pending[h] for h in hashes]).astype(self.dtype)
+                tmp_path = self._shard_file(shard) + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, matrix)
+                os.replace(tmp_path, self._shard_file(shard))
+                for row, h in enumerate(hashes):
+                    self.locations[h] = (shard, row)
+                    lines.append({"h": h, "s": shard, "r": row})
+            for p, h in self._pending_paths.items():
+                self.paths[p] = h
+                lines.append({"p": p, "h": h})
+            # ایندکس بعد از شارد نوشته می‌شود تا هیچ‌وقت به شارد ناموجود اشاره نکند
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for row in lines:
+                    f.write(json.dumps(row) + "\n")
+            self._pending = {}
+            self._pending_paths = {}
+
+    def iter_batches(self, batch_size=256, only_existing=True):
+        """Yield ``(paths, vectors)`` for every cached path (for rebuilding Milvus)."""
+        self.flush()
+        paths, vectors = [], []
+        for path, h in list(self.paths.items()):
+            if only_existing and not os.path.exists(path): continue
+            if h not in self.locations: continue
+            shard, row = self.locations[h]
+            paths.append(path)
+            vectors.append(self._shard(shard)[row])
+            if len(paths) == batch_size:
+                yield paths, np.asarray(vectors, dtype=np.float32)
+                paths, vectors = [], []
+        if paths:
+            yield paths, np.asarray(vectors, dtype=np.float32)
+
+
+def read_with_hash(path):
+    """Read a file once and return ``(content_hash, BytesIO)`` for PIL."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return content_hash(data), io.BytesIO(data)
@@ -0,0 +1,101 @@
+# core/federated.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import config
+from core.hybrid import reciprocal_rank_fusion
+
+NORMALIZATIONS = ("zscore", "minmax", "rrf")
+
+
+def _calibrate(scores, method):
+    # توزیع کسینوسی مدل‌ها فرق دارد (مثلاً SigLIP متن->عکس خیلی پایین‌تر از Jina)؛ قبل از ادغام هم‌مقیاس شوند
+    scores = np.asarray(scores, dtype=np.float64)
+    if method == "zscore":
+        return (scores - scores.mean()) / max(scores.std(), 1e-6)
+    span = scores.max() - scores.min()
+    return (scores - scores.min()) / span if span > 1e-9 else np.ones_like(scores)
+
+
+def _search_one(db, model_key, vector, candidates, filter_expr, query_params):
+    start = time.perf_counter()
+    hits = db.search_cached(model_key, vector, top_k=candidates, filter_expr=filter_expr, query_params=query_params)
+    search_ms = (time.perf_counter() - start) * 1000
+    # هر مسیر فقط یک بار (بهترین امتیاز) از هر مدل
+    best = {}
+    for hit in hits:
+        path = hit["entity"]["path"]
+        if path not in best or hit["distance"] > best[path]["distance"]:
+            best[path] = hit
+    return sorted(best.values(), key=lambda h: -h["distance"]), search_ms
+
+
+def federated_search(ai, db, model_keys, query_input, top_k=12, candidates=50, normalization="zscore",
+                     filter_expr=None, query_params=None, workers=None):
+    """Query several models' collections and merge into one list, de-duplicated by path.
+
+    The query is embedded one model at a time, so only one large model has to
+    be resident at once; each collection is searched on a worker thread as
+    soon as its vector is ready. Raw cosines are not comparable across
+    models, so each model's candidate scores are calibrated first: ``zscore``
+    / ``minmax`` per model then averaged over all models (a model that missed
+    a path scores it one standard deviation below its lowest candidate), or
+    ``rrf`` on the per-model rankings. ``filter_expr`` and ``query_params``
+    may be dicts keyed by model. Returns ``(hits, report)``; each hit keeps
+    the raw per-model cosines in ``sources``, and ``report`` has per-model
+    timings and errors.
+    """
+    if normalization not in NORMALIZATIONS:
+        raise ValueError(f"normalization must be one of {NORMALIZATIONS}")
+    model_keys = [m for m in model_keys if m in config.MODELS_CONFIG]
+    per_model = lambda value, m: value.get(m) if isinstance(value, dict) else value
+    candidates = max(candidates, top_k)
+
+    start = time.perf_counter()
+    results, report, futures = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=workers or max(1, len(model_keys))) as executor:
+        # امبدینگ مدل به مدل (فقط یک مدل بزرگ هم‌زمان در حافظه)، جستجوی کالکشن‌ها موازی
+        for m in model_keys:
+            try:
+                embed_start = time.perf_counter()
+                vector = ai.get_embedding(m, **query_input)
+                report[m] = {"embed_ms": (time.perf_counter() - embed_start) * 1000}
+                futures[m] = executor.submit(_search_one, db, m, vector, candidates,
+                                             per_model(filter_expr, m), per_model(query_params, m))
+            except Exception as e:
+                # یک مدل خراب (مثلاً کمبود حافظه) بقیه را از کار نیندازد
+                print(f"⚠️ Federated search on {m} failed: {e}")
+                report[m] = {"error": str(e)}
+        for m, future in futures.items():
+            try:
+                results[m], report[m]["search_ms"] = future.result()
+            except Exception as e:
+                print(f"⚠️ Federated search on {m} failed: {e}")
+                report[m] = {"error": str(e)}
+
+    fused, entities, sources = {}, {}, {}
+    answered = [m for m in model_keys if results.get(m)]
+    if normalization == "rrf":
+        fused = reciprocal_rank_fusion([[h["entity"]["path"] for h in results[m]] for m in answered])
+    calibrated = {}
+    for m in answered:
+        hits = results[m]
+        if normalization != "rrf":
+            calibrated[m] = dict(zip((h["entity"]["path"] for h in hits),
+                                     _calibrate([h["distance"] for h in hits], normalization)))
+        for hit in hits:
+            path = hit["entity"]["path"]
+            sources.setdefault(path, {})[m] = float(hit["distance"])
+            if not entities.get(path, {}).get("caption"):
+                entities[path] = hit["entity"]
+    if normalization != "rrf":
+        # مسیری که مدلی پیدا نکرده زیر همه کاندیداهای آن مدل است: کمترین امتیاز منهای یک انحراف معیار
+        # (نه صفر؛ در z-score صفر یعنی «متوسط»، و آن وقت توافق دو مدل از یک مدل تنها عقب می‌افتاد)
+        floors = {m: min(scores.values()) - float(np.std(list(scores.values()))) for m, scores in calibrated.items()}
+        fused = {path: sum(calibrated[m].get(path, floors[m]) for m in answered) / len(answered) for path in sources}
+
+    merged = [{"id": path, "distance": float(score), "entity": entities[path], "sources": sources[path]}
+              for path, score in fused.items()]
+    merged.sort(key=lambda h: (-h["distance"], -len(h["sources"])))
+    report["total"] = {"wall_ms": (time.perf_counter() - start) * 1000, "models": len(answered)}
+    return merged[:top_k], report
@@ -0,0 +1,72 @@
+# core/filters.py
+import json
+import os
+import time
+
+# فیلدهای اسکالر مشتق از مسیر فایل (همه با ایندکس اسکالر در کالکشن‌های جدید)
+METADATA_FIELDS = ("filename", "directory", "extension", "ingested_at")
+
+
+def path_metadata(path, ingested_at=None):
+    """Structured scalar fields for one image path."""
+    directory, filename = os.path.split(path)
+    return {
+        "filename": filename,
+        "directory": directory,
+        "extension": os.path.splitext(filename)[1].lstrip(".").lower(),
+        "ingested_at": int(ingested_at if ingested_at is not None else time.time()),
+    }
+
+
+def literal(value):
+    """Quote a user value as a Milvus string literal (no way to break out of the quotes)."""
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def _escape_like(value):
+    # % و _ کاربر wildcard حساب نشوند
+    return str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def prefix_match(field, value):
+    """``field like "value%"`` — a prefix match, which scalar indexes can serve."""
+    return f"{field} like {literal(_escape_like(value) + '%')}"
+
+
+def equals(field, value):
+    return f"{field} == {literal(value)}"
+
+
+def one_of(field, values):
+    return f"{field} in [{', '.join(literal(v) for v in values)}]"
+
+
+def build_filter(filename_prefix=None, directory=None, directory_prefix=None, extensions=None,
+                 ingested_after=None, ingested_before=None, indexed=True):
+    """AND of the given conditions as a safe Milvus expression, or None.
+
+    Values are always quoted with ``literal``, never pasted into the
+    expression. With ``indexed=False`` (collection created before the metadata
+    fields existed) the conditions fall back to expressions on ``path``, except
+    ``filename_prefix``: ``like`` cannot anchor to the last path segment, so it
+    raises ValueError there (migrate the collection to filter on file names).
+    """
+    clauses = []
+    if indexed:
+        if filename_prefix: clauses.append(prefix_match("filename", filename_prefix))
+        if directory: clauses.append(equals("directory", directory.rstrip("/")))
+        if directory_prefix: clauses.append(prefix_match("directory", directory_prefix))
+        if extensions: clauses.append(one_of("extension", [e.lstrip(".").lower() for e in extensions]))
+        if ingested_after is not None: clauses.append(f"ingested_at >= {int(ingested_after)}")
+        if ingested_before is not None: clauses.append(f"ingested_at < {int(ingested_before)}")
+    else:
+        # کالکشن قدیمی: فقط path داریم (پیشوند پوشه هنوز سریع است، بقیه اسکن کامل)
+        # "%/prefix%" هر بخش مسیر را می‌گیرد ("cat" -> /data/cats/dog.jpg)؛ بدون فیلد filename دقیق نمی‌شود
+        if filename_prefix:
+            raise ValueError("filename_prefix needs the indexed 'filename' field; run migrate_collection.py first")
+        if directory: clauses.append(prefix_match("path", directory.rstrip("/") + "/"))
+        if directory_prefix: clauses.append(prefix_match("path", directory_prefix))
+        if extensions:
+            clauses.append("(" + " or ".join(
+                f"path like {literal('%.' + _escape_like(e.lstrip('.')))}" for e in extensions) + ")")
+    return " and ".join(clauses) if clauses else None
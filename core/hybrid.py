@@ -0,0 +1,74 @@
+# core/hybrid.py
+import time
+import config
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k=None):
+    """Fuse ranked id lists (best first) -> ``{id: score}`` scaled to (0, 1].
+
+    Each list adds ``w / (k + rank)``; dividing by the best possible total
+    (first place everywhere) keeps scores comparable across queries.
+    """
+    k = config.HYBRID_RRF_K if k is None else k
+    weights = weights or [1.0] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, row_id in enumerate(ranking, start=1):
+            fused[row_id] = fused.get(row_id, 0.0) + weight / (k + rank)
+    best = sum(weights) / (k + 1)
+    return {row_id: score / best for row_id, score in fused.items()} if best else fused
+
+
+def weighted_fusion(dense, keyword, alpha):
+    """``alpha * cosine + (1 - alpha) * bm25 / max(bm25)``; a missing side counts as 0."""
+    top_bm25 = max(keyword.values(), default=0.0) or 1.0
+    return {
+        row_id: alpha * dense.get(row_id, 0.0) + (1 - alpha) * keyword.get(row_id, 0.0) / top_bm25
+        for row_id in set(dense) | set(keyword)
+    }
+
+
+def hybrid_search(db, text_index, model_key, query_vector, query_text, top_k=12, candidates=None,
+                  fusion="rrf", alpha=0.5, filter_expr=None, threshold=None, query_params=None):
+    """Dense ANN + BM25 over captions, merged by reciprocal rank fusion or weighted scores.
+
+    ``alpha`` is the weight of the vector side (0 = keywords only, 1 = vectors
+    only). ``threshold`` applies to the vector side's cosine; ``filter_expr``
+    to both sides. ``distance`` of each hit is the fused score, with
+    ``vector_distance`` / ``bm25`` kept for display. Returns ``(hits, timings)``.
+    """
+    candidates = max(candidates or config.HYBRID_CANDIDATES, top_k)
+    timings = {}
+
+    start = time.perf_counter()
+    dense_hits = db.search_cached(model_key, query_vector, top_k=candidates, filter_expr=filter_expr,
+                                  threshold=threshold, query_params=query_params) if query_vector is not None else []
+    timings["ann_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    keyword_hits = text_index.search(query_text, top_k=candidates) if query_text else []
+    if filter_expr and keyword_hits:
+        # همان فیلتر سمت Milvus روی کاندیداهای کلمه‌ای
+        allowed = db.filter_ids(model_key, [h[0] for h in keyword_hits], filter_expr)
+        keyword_hits = [h for h in keyword_hits if h[0] in allowed]
+    timings["bm25_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    dense = {h["id"]: h["distance"] for h in dense_hits}
+    keyword = {h[0]: h[1] for h in keyword_hits}
+    if fusion == "rrf":
+        fused = reciprocal_rank_fusion([[h["id"] for h in dense_hits], [h[0] for h in keyword_hits]],
+                                       weights=[alpha, 1 - alpha])
+    else:
+        fused = weighted_fusion(dense, keyword, alpha)
+
+    entities = {h[0]: {"path": h[2], "caption": h[3]} for h in keyword_hits}
+    entities.update({h["id"]: h["entity"] for h in dense_hits})
+    hits = [
+        {"id": row_id, "distance": float(score), "entity": entities[row_id],
+         "vector_distance": dense.get(row_id), "bm25": keyword.get(row_id)}
+        for row_id, score in fused.items() if score > 0
+    ]
+    hits.sort(key=lambda h: -h["distance"])
+    timings["fusion_ms"] = (time.perf_counter() - start) * 1000
+    return hits[:top_k], timings
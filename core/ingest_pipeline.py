@@ -0,0 +1,279 @@
+# core/ingest_pipeline.py
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from core.embedding_cache import read_with_hash
+
+_DONE = object()
+
+
+class StageStats:
+    """Counts items and busy time for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy += seconds
+
+    @property
+    def throughput(self):
+        # تعداد آیتم در هر ثانیه کار واقعی این مرحله
+        return self.items / self.busy if self.busy else 0.0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "batches": self.batches,
+            "busy_s": round(self.busy, 3),
+            "items_per_s": round(self.throughput, 2),
+        }
+
+
+class IngestPipeline:
+    """Streaming indexer: decode -> embed -> [caption] -> insert, with the stages overlapping.
+
+    * decode: a thread pool reads, hashes (for the embedding cache), opens
+      and preprocesses whole batches
+      (``AIEngine.prepare_image_batch``); at most ``prefetch_batches`` ready
+      batches wait in a bounded queue.
+    * embed: runs on the calling thread so Streamlit callbacks stay safe.
+    * caption (optional): a dedicated thread calls ``caption_fn(paths) ->
+      (captions, errors)`` once per batch (``AIEngine.generate_captions``).
+      A failed caption is stored as "" and listed in ``caption_errors`` so a
+      later backfill can retry it; the image itself is still indexed.
+    * insert: a dedicated thread writes finished batches to Milvus and, if a
+      manifest is given, commits them to it.
+    """
+
+    def __init__(self, ai, db, model_key, batch_size=16, decode_workers=4,
+                 prefetch_batches=4, caption_fn=None, manifest=None):
+        self.ai = ai
+        self.db = db
+        self.model_key = model_key
+        self.batch_size = batch_size
+        self.decode_workers = max(1, decode_workers)
+        self.prefetch_batches = max(1, prefetch_batches)
+        self.caption_fn = caption_fn
+        self.manifest = manifest
+        self.cache = ai.embedding_cache(model_key)
+        self.token_store = ai.token_store(model_key)
+        self.cache_hits = 0
+
+        stages = ("decode", "embed", "caption", "insert") if caption_fn else ("decode", "embed", "insert")
+        self.stats = {name: StageStats(name) for name in stages}
+        self.errors = []          # [(path, message)]
+        self.caption_errors = []  # [(path, message)]؛ تصویر با کپشن خالی ایندکس شده
+        self.inserted = 0
+        self.wall_time = 0.0
+        self._insert_error = None
+        self._stop = threading.Event()
+
+    # --- مرحله ۱: خواندن، هش و پیش‌پردازش (روی worker ها) ---
+    def _decode(self, batch_paths):
+        """Returns ``(ok_paths, hashes, cached, missing, batch, errors)``.
+
+        ``cached`` maps content hash -> vector for cache hits; only the
+        ``missing`` positions are decoded into ``batch`` for the model.
+        """
+        start = time.perf_counter()
+        ok_paths, hashes, buffers, errors = [], [], [], []
+        for path in batch_paths:
+            try:
+                if self.cache is not None or self.token_store is not None:
+                    h, buf = read_with_hash(path)
+                else:
+                    h, buf = None, path
+                ok_paths.append(path)
+                hashes.append(h)
+                buffers.append(buf)
+            except Exception as e:
+                errors.append((path, str(e)))
+
+        cached = self.ai.cached_vectors(self.model_key, hashes)
+        missing, images = [], []
+        for i, h in enumerate(hashes):
+            if h in cached: continue
+            try:
+                images.append(self.ai._load_image(Image.open(buffers[i]) if h else buffers[i]))
+                missing.append(i)
+            except Exception as e:
+                errors.append((ok_paths[i], str(e)))
+
+        batch = None
+        if images:
+            try:
+                batch = self.ai.prepare_image_batch(self.model_key, images)
+            except Exception as e:
+                errors.extend((ok_paths[i], str(e)) for i in missing)
+                missing = []
+
+        # فقط مسیرهایی که یا در کش هستند یا آماده اجرای مدل‌اند می‌مانند
+        keep = [i for i, h in enumerate(hashes) if h in cached] + missing
+        keep.sort()
+        position = {old: new for new, old in enumerate(keep)}
+        ok_paths = [ok_paths[i] for i in keep]
+        hashes = [hashes[i] for i in keep]
+        missing = [position[i] for i in missing]
+
+        self.stats["decode"].add(len(ok_paths), time.perf_counter() - start)
+        return ok_paths, hashes, cached, missing, batch, errors
+
+    def _embed(self, ok_paths, hashes, cached, missing, batch):
+        # --- مرحله ۲: اجرای مدل فقط برای آیتم‌هایی که در کش نبودند ---
+        vectors = self.ai.embed_missing(self.model_key, ok_paths, hashes, cached, missing, batch)
+        self.cache_hits += len(ok_paths) - len(missing)
+        return vectors
+
+    def _put(self, q, item):
+        # put با امکان توقف، تا اگر مصرف‌کننده متوقف شد گیر نکنیم
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _handoff(self, q, item, consumer):
+        # put تا وقتی مصرف‌کننده زنده است (بعد از _stop هم صف‌ها باید تخلیه شوند)
+        while consumer.is_alive():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, paths, executor, ready_q):
+        for i in range(0, len(paths), self.batch_size):
+            if self._stop.is_set(): break
+            future = executor.submit(self._decode, paths[i : i + self.batch_size])
+            if not self._put(ready_q, future): break
+        self._put(ready_q, _DONE)
+
+    # --- مرحله ۳ (اختیاری): کپشن بچی (thread جدا) ---
+    def _caption_worker(self, caption_q, insert_q, inserter):
+        while True:
+            item = caption_q.get()
+            if item is _DONE: break
+            if self._insert_error is not None: continue  # فقط تخلیه صف
+            paths, vectors = item
+            start = time.perf_counter()
+            try:
+                captions, errors = self.caption_fn(paths)
+            except Exception as e:
+                captions, errors = [None] * len(paths), [(p, str(e)) for p in paths]
+            self.caption_errors.extend(errors)
+            self.stats["caption"].add(len(paths), time.perf_counter() - start)
+            self._handoff(insert_q, (paths, vectors, [c or "" for c in captions]), inserter)
+        self._handoff(insert_q, _DONE, inserter)
+
+    # --- مرحله ۴: ذخیره در دیتابیس (thread جدا) ---
+    def _insert_worker(self, insert_q):
+        while True:
+            item = insert_q.get()
+            if item is _DONE: return
+            paths, vectors, captions = item
+            start = time.perf_counter()
+            try:
+                res = self.db.insert_images(self.model_key, vectors, paths, captions)
+                # ثبت بچ در manifest تا اجرای بعدی از همین‌جا ادامه دهد
+                if self.manifest is not None:
+                    self.manifest.record(paths, list(res["ids"]) if res and "ids" in res else None)
+            except Exception as e:
+                self._insert_error = e
+                self._stop.set()
+                return
+            self.stats["insert"].add(len(paths), time.perf_counter() - start)
+            self.inserted += len(paths)
+
+    def run(self, paths, on_progress=None):
+        """Index ``paths``; ``on_progress(done, total, pipeline)`` is called after each batch.
+
+        Returns the number of inserted rows. Raises the first DB error, since
+        continuing without a database is pointless.
+        """
+        total = len(paths)
+        done = 0
+        started = time.perf_counter()
+        ready_q = queue.Queue(maxsize=self.prefetch_batches)
+        insert_q = queue.Queue(maxsize=2)
+
+        inserter = threading.Thread(target=self._insert_worker, args=(insert_q,), daemon=True)
+        inserter.start()
+        # با کپشن، خروجی embed اول به صف کپشن می‌رود
+        last_stage, out_q = inserter, insert_q
+        if self.caption_fn:
+            caption_q = queue.Queue(maxsize=2)
+            last_stage = threading.Thread(target=self._caption_worker, args=(caption_q, insert_q, inserter), daemon=True)
+            last_stage.start()
+            out_q = caption_q
+
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as executor:
+            producer = threading.Thread(target=self._produce, args=(paths, executor, ready_q), daemon=True)
+            producer.start()
+            try:
+                while True:
+                    future = ready_q.get()
+                    if future is _DONE or self._stop.is_set(): break
+                    ok_paths, hashes, cached, missing, batch, errors = future.result()
+                    self.errors.extend(errors)
+                    done += len(ok_paths) + len(errors)
+
+                    if ok_paths:
+                        start = time.perf_counter()
+                        try:
+                            vectors = self._embed(ok_paths, hashes, cached, missing, batch)
+                        except Exception as e:
+                            self.errors.extend((path, str(e)) for path in ok_paths)
+                            ok_paths = []
+                        else:
+                            self.stats["embed"].add(len(ok_paths), time.perf_counter() - start)
+                            self._put(out_q, (ok_paths, vectors) if self.caption_fn else (ok_paths, vectors, None))
+
+                    if on_progress: on_progress(done, total, self)
+            finally:
+                self._stop.set()
+                producer.join()
+                # آزاد کردن batch هایی که هنوز در صف مانده‌اند
+                while not ready_q.empty():
+                    item = ready_q.get_nowait()
+                    if item is not _DONE: item.cancel()
+                if self.cache is not None:
+                    self.cache.flush()
+                if self.token_store is not None:
+                    self.token_store.flush()
+
+        # صبر برای تمام شدن کپشن و اینسرت‌های باقی‌مانده
+        self._handoff(out_q, _DONE, last_stage)
+        last_stage.join()
+        inserter.join()
+        self.wall_time = time.perf_counter() - started
+
+        if self._insert_error is not None:
+            raise self._insert_error
+        return self.inserted
+
+    def report(self):
+        # گزارش throughput هر مرحله + کل
+        rows = [s.as_dict() for s in self.stats.values()]
+        rows.append({"stage": "cache hits", "items": self.cache_hits, "batches": 0, "busy_s": 0.0, "items_per_s": 0.0})
+        rows.append({
+            "stage": "total (wall)",
+            "items": self.inserted,
+            "batches": self.stats["insert"].batches,
+            "busy_s": round(self.wall_time, 3),
+            "items_per_s": round(self.inserted / self.wall_time, 2) if self.wall_time else 0.0,
+        })
+        return rows
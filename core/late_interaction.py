@@ -0,0 +1,55 @@
+# core/late_interaction.py
+import time
+import numpy as np
+
+
+def maxsim_score(query_tokens, doc_tokens):
+    """ColBERT MaxSim of one document: best-matching document token per query
+    token, averaged over query tokens (so scores stay on the cosine scale)."""
+    return float((query_tokens @ np.asarray(doc_tokens, dtype=np.float32).T).max(axis=1).mean())
+
+
+def maxsim_scores(query_tokens, doc_tokens_list):
+    """``maxsim_score`` for many documents, one ``q @ d.T`` at a time."""
+    q = np.asarray(query_tokens, dtype=np.float32)
+    return np.array([maxsim_score(q, d) for d in doc_tokens_list], dtype=np.float32)
+
+
+def pool_tokens(tokens, factor):
+    # کاهش تعداد توکن‌ها: میانگین هر factor توکن پشت سر هم
+    if factor <= 1 or len(tokens) <= factor: return tokens
+    n = len(tokens) // factor * factor
+    pooled = tokens[:n].reshape(-1, factor, tokens.shape[1]).mean(axis=1)
+    if n < len(tokens):
+        pooled = np.vstack([pooled, tokens[n:].mean(axis=0, keepdims=True)])
+    return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+
+def late_interaction_search(db, token_store, model_key, query_vector, query_tokens, top_k=12,
+                            candidates=100, filter_expr=None, threshold=None, query_params=None):
+    """Pooled-vector ANN for candidates, then MaxSim re-rank on stored tokens.
+
+    Returns ``(hits, timings)``; hits keep the Milvus hit shape with
+    ``distance`` replaced by the MaxSim score (``ann_distance`` keeps the old one).
+    """
+    timings = {}
+    start = time.perf_counter()
+    hits = db.search_cached(model_key, query_vector, top_k=max(candidates, top_k),
+                            filter_expr=filter_expr, query_params=query_params)
+    timings["candidates_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    # هر سند جدا از شارد mmap خوانده، امتیاز داده و دور ریخته می‌شود (حافظه = یک سند)
+    q = np.asarray(query_tokens, dtype=np.float32)
+    scores = {path: maxsim_score(q, doc)
+              for path, doc in token_store.iter_by_paths([h["entity"]["path"] for h in hits])}
+    reranked = [{**hit, "ann_distance": hit["distance"], "distance": scores[hit["entity"]["path"]]}
+                for hit in hits if hit["entity"]["path"] in scores]
+    # کاندیداهایی که توکن ذخیره‌شده ندارند با امتیاز ANN در انتها می‌آیند
+    reranked.sort(key=lambda h: -h["distance"])
+    reranked.extend(h for h in hits if h["entity"]["path"] not in scores)
+    timings["maxsim_ms"] = (time.perf_counter() - start) * 1000
+
+    if threshold is not None:
+        reranked = [h for h in reranked if h["distance"] >= threshold]
+    return reranked[:top_k], timings
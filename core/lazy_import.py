@@ -0,0 +1,33 @@
+# core/lazy_import.py
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access.
+
+    ``torch = LazyModule("torch")`` at the top of a file keeps ``torch.no_grad()``
+    call sites unchanged while pages that never run a model skip the import.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'loaded' if self.loaded else 'not loaded'})>"
@@ -0,0 +1,56 @@
+# core/link_scanner.py
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _list_dir(directory):
+    # یک بار list کردن پوشه به جای stat کردن تک‌تک فایل‌ها
+    try:
+        with os.scandir(directory) as entries:
+            return directory, {e.name for e in entries if e.is_file()}
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return directory, None
+
+
+def scan_links(batches, workers=16, progress=None):
+    """Compare indexed paths with what is on disk, one ``os.scandir`` per directory.
+
+    ``batches`` yields dicts with ``id`` and ``path`` arrays (``DBManager.iter_collection``).
+    Returns ``{"orphaned_records", "orphaned_files", "records", "directories"}``:
+    records whose file is gone, and image files in those directories that no
+    record points to.
+    """
+    by_dir = defaultdict(dict)   # directory -> {filename: [ids]}
+    records = 0
+    for batch in batches:
+        for row_id, path in zip(batch["id"], batch["path"]):
+            directory, name = os.path.split(path)
+            by_dir[directory].setdefault(name, []).append(int(row_id))
+            records += 1
+
+    orphaned_records, orphaned_files = [], []
+    directories = list(by_dir)
+    # برای استورهای شبکه‌ای، list کردن پوشه‌ها به صورت موازی
+    workers = max(1, min(workers, len(directories)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, (directory, on_disk) in enumerate(executor.map(_list_dir, directories)):
+            indexed = by_dir[directory]
+            on_disk = on_disk or set()
+            for name, ids in indexed.items():
+                if name not in on_disk:
+                    path = os.path.join(directory, name)
+                    orphaned_records.extend({'id': row_id, 'path': path} for row_id in ids)
+            for name in on_disk:
+                if name.lower().endswith(IMAGE_EXTENSIONS) and name not in indexed:
+                    orphaned_files.append(os.path.join(directory, name))
+            if progress: progress((i + 1) / len(directories))
+
+    return {
+        "orphaned_records": orphaned_records,
+        "orphaned_files": sorted(orphaned_files),
+        "records": records,
+        "directories": len(directories),
+    }
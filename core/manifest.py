@@ -0,0 +1,150 @@
+# core/manifest.py
+import json
+import os
+import threading
+import config
+
+
+class IndexManifest:
+    """Per-collection record of which files are already in Milvus.
+
+    Stored as an append-only JSONL file (one line per committed file, last
+    line wins), so a run that dies mid-way keeps every batch it committed
+    and the next run simply resumes after it.
+    """
+
+    def __init__(self, collection_name, root=None):
+        self.collection_name = collection_name
+        self.root = root or config.MANIFEST_DIR
+        self.file_path = os.path.join(self.root, f"{collection_name}.jsonl")
+        self.entries = {}   # path -> {"size", "mtime", "ids"}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def fingerprint(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def load(self):
+        self.entries = {}
+        if not os.path.exists(self.file_path): return
+        lines = 0
+        with open(self.file_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # خط ناقص آخر (اگر وسط نوشتن قطع شده باشد)
+                    continue
+                lines += 1
+                if row.get("deleted"):
+                    self.entries.pop(row["path"], None)
+                else:
+                    self.entries[row["path"]] = {"size": row["size"], "mtime": row["mtime"], "ids": row.get("ids", [])}
+        # اگر فایل خیلی بزرگ‌تر از وضعیت واقعی شده، فشرده‌اش کن
+        if lines > 2 * max(len(self.entries), 1000):
+            self.compact()
+
+    def compact(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for path, e in self.entries.items():
+                f.write(json.dumps({"path": path, **e}) + "\n")
+        os.replace(tmp_path, self.file_path)
+
+    def reset(self):
+        # وقتی کالکشن پاک شده باشد manifest هم دیگر معتبر نیست
+        self.entries = {}
+        if os.path.exists(self.file_path): os.remove(self.file_path)
+
+    def plan(self, paths):
+        """Split ``paths`` into work to do.
+
+        Returns ``(todo, stale_ids, skipped)``: files that are new or changed,
+        Milvus ids of the old versions of changed files, and the number of
+        unchanged files.
+        """
+        todo, stale_ids, skipped = [], [], 0
+        for path in paths:
+            try:
+                size, mtime = self.fingerprint(path)
+            except OSError:
+                continue
+            entry = self.entries.get(path)
+            if entry is None:
+                todo.append(path)
+            elif entry["size"] == size and entry["mtime"] == mtime:
+                skipped += 1
+            else:
+                todo.append(path)
+                stale_ids.extend(entry["ids"])
+        return todo, stale_ids, skipped
+
+    def record(self, paths, ids=None):
+        # بعد از اینسرت موفق هر بچ صدا زده می‌شود (commit)
+        if ids is None or len(ids) != len(paths): ids = [None] * len(paths)
+        rows = []
+        for path, row_id in zip(paths, ids):
+            try:
+                size, mtime = self.fingerprint(path)
+            except OSError:
+                continue
+            entry = {"size": size, "mtime": mtime, "ids": [row_id] if row_id is not None else []}
+            rows.append({"path": path, **entry})
+        self._append(rows)
+
+    def seed(self, path_ids):
+        """Record rows already in Milvus (``{path: [ids]}``) without re-embedding them."""
+        rows = []
+        for path, ids in path_ids.items():
+            try:
+                size, mtime = self.fingerprint(path)
+            except OSError:
+                continue
+            rows.append({"path": path, "size": size, "mtime": mtime, "ids": list(ids)})
+        self._append(rows)
+        return len(rows)
+
+    def sync(self, db, model_key):
+        """Line the manifest up with the collection before planning a run.
+
+        A missing collection invalidates the manifest. An empty manifest next
+        to a populated collection (indexed before manifests existed) is seeded
+        from its ``id, path`` rows, so those files are not inserted twice.
+        Returns the number of seeded paths.
+        """
+        if not db.client.has_collection(self.collection_name):
+            self.reset()
+            return 0
+        if self.entries: return 0
+        path_ids = {}
+        for batch in db.iter_collection(model_key, ("id", "path")):
+            for row_id, path in zip(batch["id"], batch["path"]):
+                path_ids.setdefault(path, []).append(int(row_id))
+        return self.seed(path_ids)
+
+    def _append(self, rows):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            for row in rows:
+                self.entries[row["path"]] = {"size": row["size"], "mtime": row["mtime"], "ids": row["ids"]}
+
+    def forget(self, paths):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                for path in paths:
+                    if self.entries.pop(path, None) is not None:
+                        f.write(json.dumps({"path": path, "deleted": True}) + "\n")
+
+    def __len__(self):
+        return len(self.entries)
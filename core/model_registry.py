@@ -0,0 +1,137 @@
+# core/model_registry.py
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def resident_bytes(obj, _seen=None):
+    """Approximate memory held by a loaded model (tensors in state_dict, ONNX file size)."""
+    import torch
+
+    seen = set() if _seen is None else _seen
+    if isinstance(obj, torch.Tensor):
+        # وزن‌های گره‌خورده (tied) فقط یک بار شمرده شوند
+        key = (obj.device.type, obj.data_ptr())
+        if key in seen: return 0
+        seen.add(key)
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, torch.nn.Module):
+        # state_dict وزن‌های packed لایه‌های کوانتیزه را هم شامل می‌شود
+        return sum(resident_bytes(v, seen) for v in obj.state_dict(keep_vars=True).values())
+    if isinstance(obj, (tuple, list)):
+        return sum(resident_bytes(v, seen) for v in obj)
+    path = getattr(obj, "path", None)
+    if isinstance(path, str) and path.endswith(".onnx") and os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+
+class ModelRegistry:
+    """Process-wide LRU of loaded models with a memory budget.
+
+    ``get(key, loader)`` returns the resident model or calls ``loader()``. After
+    a load, least-recently-used models are evicted until the total fits in
+    ``budget_bytes`` (the model just requested is never evicted). A model whose
+    size is already known from an earlier load makes room *before* loading, so
+    peak memory stays close to the budget. ``budget_bytes=None`` disables eviction.
+    """
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self._models = OrderedDict()   # key -> {"value", "bytes", "loaded_at", "last_used", "hits", "load_s"}
+        self._known_sizes = {}         # key -> bytes از لود قبلی
+        self._loading = {}             # key -> Lock تا یک مدل دو بار همزمان لود نشود (مثلاً preload + درخواست)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._touch(key)
+            if entry is not None: return entry["value"]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                # شاید thread دیگری همین الان لودش کرده باشد
+                entry = self._touch(key)
+                if entry is not None: return entry["value"]
+                self._evict_for(key, self._known_sizes.get(key, 0))
+            start = time.perf_counter()
+            try:
+                value = loader()
+            except Exception:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            size = resident_bytes(value)
+            with self._lock:
+                now = time.time()
+                self._models[key] = {"value": value, "bytes": size, "loaded_at": now, "last_used": now,
+                                     "hits": 0, "load_s": time.perf_counter() - start}
+                self._known_sizes[key] = size
+                self._loading.pop(key, None)
+                self._evict_for(key, 0)
+            return value
+
+    def _touch(self, key):
+        entry = self._models.get(key)
+        if entry is not None:
+            self._models.move_to_end(key)
+            entry["last_used"] = time.time()
+            entry["hits"] += 1
+        return entry
+
+    def _evict_for(self, keep_key, incoming_bytes):
+        # قفل باید گرفته شده باشد
+        if self.budget_bytes is None: return
+        while self._models:
+            total = sum(e["bytes"] for e in self._models.values()) + incoming_bytes
+            if total <= self.budget_bytes: break
+            victim = next((k for k in self._models if k != keep_key), None)
+            if victim is None: break
+            self._release(victim)
+
+    def _release(self, key):
+        entry = self._models.pop(key)
+        print(f"♻️ Evicting {key} ({entry['bytes'] / 2**20:.0f} MB)")
+        del entry
+        self.evictions += 1
+        self.free_memory()
+
+    @staticmethod
+    def free_memory():
+        # مدل فقط وقتی آزاد می‌شود که ارجاع دیگری به آن نمانده باشد
+        gc.collect()
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, key):
+        with self._lock:
+            if key in self._models: self._release(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._models):
+                self._release(key)
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(e["bytes"] for e in self._models.values())
+
+    def stats(self):
+        """One row per resident model, most recently used last."""
+        with self._lock:
+            return [
+                {"model": " / ".join(map(str, key)) if isinstance(key, tuple) else str(key),
+                 "resident_mb": round(e["bytes"] / 2**20, 1),
+                 "load_s": round(e["load_s"], 1),
+                 "hits": e["hits"],
+                 "idle_s": round(time.time() - e["last_used"], 1)}
+                for key, e in self._models.items()
+            ]
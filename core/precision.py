@@ -0,0 +1,120 @@
+# core/precision.py
+import contextlib
+import os
+import re
+import numpy as np
+import config
+from core.lazy_import import LazyModule
+
+torch = LazyModule("torch")
+
+# fp32: مرجع / fp16: فقط GPU / bf16: CPU و GPU / int8_dynamic: فقط CPU / onnx: انکودر تصویر با ONNX Runtime
+PRECISIONS = ("fp32", "fp16", "bf16", "int8_dynamic", "onnx")
+
+# مدل‌هایی که انکودر تصویرشان یک تنسور pixel_values می‌گیرد و قابل export است
+ONNX_TYPES = ("siglip", "open_clip")
+
+_warned = set()
+
+
+def resolve_precision(model_key, precision=None):
+    """Configured inference precision for a model, downgraded to what the device supports."""
+    cfg = config.MODELS_CONFIG[model_key]
+    precision = precision or cfg.get("precision", "fp32")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}' for {model_key}; expected one of {PRECISIONS}")
+    fallback = None
+    if precision == "onnx" and config.DEVICE == "cuda":
+        fallback = "fp16"  # خروجی ONNX فقط با CPUExecutionProvider اجرا می‌شود
+    elif precision == "fp16" and config.DEVICE != "cuda":
+        fallback = "bf16"  # fp16 روی CPU کند و ناپایدار است
+    elif precision == "int8_dynamic" and config.DEVICE == "cuda":
+        fallback = "fp16"  # کوانتیزه دینامیک torch فقط کرنل CPU دارد
+    elif precision == "onnx" and cfg["type"] not in ONNX_TYPES:
+        fallback = "fp32"
+    if fallback:
+        if (model_key, precision) not in _warned:
+            _warned.add((model_key, precision))
+            print(f"⚠️ {precision} is not available for {model_key} on {config.DEVICE}; using {fallback}.")
+        return fallback
+    return precision
+
+
+def torch_dtype(precision):
+    """Weight dtype to load the model with."""
+    return {"fp16": torch.float16, "bf16": torch.bfloat16}.get(precision, torch.float32)
+
+
+def apply_precision(model, precision):
+    """Cast or quantize an already loaded fp32 model in place of the original."""
+    if precision in ("fp16", "bf16"):
+        return model.to(torch_dtype(precision))
+    if precision == "int8_dynamic":
+        # فقط لایه‌های Linear: وزن int8، اکتیویشن‌ها هنگام اجرا کوانتیزه می‌شوند
+        from torch.ao.quantization import quantize_dynamic
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def inference_context(precision):
+    """autocast for half-precision models so fp32 inputs meet fp16/bf16 weights."""
+    if precision in ("fp16", "bf16"):
+        return torch.autocast(device_type="cuda" if config.DEVICE == "cuda" else "cpu", dtype=torch_dtype(precision))
+    return contextlib.nullcontext()
+
+
+def _image_tower(model, model_type):
+    # pixel_values -> بردار نرمال؛ همان منطق embed_image_batch برای export
+    class ImageTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            if model_type == "siglip":
+                features = self.model.get_image_features(pixel_values=pixel_values)
+            else:
+                features = self.model.encode_image(pixel_values)
+            return features / features.norm(p=2, dim=-1, keepdim=True)
+
+    return ImageTower()
+
+
+class OnnxImageEncoder:
+    """Image tower exported to ONNX and run with ONNX Runtime (CPU).
+
+    The export is done once from the fp32 model and cached under ``ONNX_DIR``.
+    Text queries keep using the torch model.
+    """
+
+    def __init__(self, model_key, model, model_type, sample_batch, root=None):
+        import onnxruntime as ort
+
+        model_id = config.MODELS_CONFIG[model_key]["model_id"]
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "__", model_id)
+        self.path = os.path.join(root or config.ONNX_DIR, f"{safe_name}_image.onnx")
+        if not os.path.exists(self.path):
+            self.export(model, model_type, sample_batch, self.path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+
+    @staticmethod
+    def export(model, model_type, sample_batch, path):
+        print(f"📦 Exporting image encoder to {path}...")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tower = _image_tower(model, model_type).eval()
+        tmp_path = path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                tower, (sample_batch.cpu(),), tmp_path,
+                input_names=["pixel_values"], output_names=["embeddings"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+                opset_version=17,
+            )
+        os.replace(tmp_path, path)
+
+    def __call__(self, pixel_values):
+        if isinstance(pixel_values, torch.Tensor): pixel_values = pixel_values.cpu().numpy()
+        (features,) = self.session.run(None, {"pixel_values": np.asarray(pixel_values, dtype=np.float32)})
+        return features
@@ -0,0 +1,72 @@
+# core/reduction.py
+import os
+import re
+import numpy as np
+import config
+
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def stored_dimension(model_key):
+    """Dimension of vectors stored in Milvus (after the optional reduction stage)."""
+    cfg = config.MODELS_CONFIG[model_key]
+    reduction = cfg.get("reduction")
+    return reduction["dim"] if reduction else cfg["dimension"]
+
+
+class Reducer:
+    """Optional per-model reduction of full model vectors before they reach Milvus.
+
+    * ``matryoshka``: keep the first ``dim`` components and re-normalise. This is
+      what Jina CLIP v2's native ``truncate_dim`` does, applied after the fact so
+      the embedding cache keeps full vectors.
+    * ``pca``: project onto the top ``dim`` principal components fitted with a
+      NumPy SVD on a sample (see ``fit_reduction.py``); the projection is stored
+      under ``REDUCTION_DIR``.
+    """
+
+    def __init__(self, model_key, root=None):
+        cfg = config.MODELS_CONFIG[model_key]
+        reduction = cfg.get("reduction") or {}
+        self.model_key = model_key
+        self.method = reduction.get("method")
+        self.dim = reduction.get("dim", cfg["dimension"])
+        self.full_dim = cfg["dimension"]
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "__", cfg["model_id"])
+        self.path = os.path.join(root or config.REDUCTION_DIR, f"{safe_name}_pca{self.dim}.npz")
+        self.mean = None
+        self.components = None
+        if self.method == "pca" and os.path.exists(self.path):
+            data = np.load(self.path)
+            self.mean, self.components = data["mean"], data["components"]
+
+    @property
+    def active(self):
+        return self.method is not None and self.dim < self.full_dim
+
+    def fit(self, sample):
+        """Fit PCA on ``sample`` (n, full_dim) and persist the projection."""
+        x = np.asarray(sample, dtype=np.float32)
+        if len(x) < self.dim:
+            raise ValueError(f"PCA to {self.dim} dims needs at least {self.dim} samples, got {len(x)}")
+        self.mean = x.mean(axis=0)
+        # SVD روی داده مرکز‌شده؛ ردیف‌های vt جهت‌های اصلی به ترتیب واریانس هستند
+        _, s, vt = np.linalg.svd(x - self.mean, full_matrices=False)
+        self.components = vt[: self.dim].astype(np.float32)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.savez(self.path, mean=self.mean, components=self.components)
+        explained = (s[: self.dim] ** 2).sum() / (s ** 2).sum()
+        return float(explained)
+
+    def transform(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1: vectors = vectors[None, :]
+        if not self.active or vectors.shape[1] == self.dim:
+            return vectors
+        if self.method == "matryoshka":
+            return _normalize(vectors[:, : self.dim])
+        if self.components is None:
+            raise RuntimeError(f"No PCA projection for {self.model_key}; run fit_reduction.py first")
+        return _normalize((vectors - self.mean) @ self.components.T)
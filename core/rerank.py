@@ -0,0 +1,62 @@
+# core/rerank.py
+import os
+import time
+import numpy as np
+import config
+
+EXACT = "exact"
+
+
+def two_stage_search(ai, db, model_key, query_vector, query_input, top_k=12, candidates=100,
+                     rescore_with=EXACT, filter_expr=None, threshold=None, query_params=None):
+    """Cheap ANN recall on ``model_key``'s collection, then exact re-scoring.
+
+    ``rescore_with`` is ``"exact"`` (full-precision vectors of the same model,
+    read from the embedding cache only; uncached candidates keep their ANN
+    score) or another ``MODELS_CONFIG`` key whose model re-scores the
+    candidates, ``RERANK_BATCH_SIZE`` images per forward pass. Returns
+    ``(hits, timings)``; ``ann_distance`` keeps the stage-one score.
+    """
+    timings = {}
+    start = time.perf_counter()
+    hits = db.search_cached(model_key, query_vector, top_k=max(candidates, top_k),
+                            filter_expr=filter_expr, query_params=query_params)
+    timings["ann_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    query = ai.get_embedding(model_key if rescore_with == EXACT else rescore_with, **query_input)
+    query = np.asarray(query, dtype=np.float32)
+    timings["query_embed_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    scores = {}   # index of hit -> score
+    if rescore_with == EXACT:
+        # فقط از کش دیسکی؛ مدل برای هر کوئری دوباره روی کاندیداها اجرا نمی‌شود
+        cache = ai.embedding_cache(model_key)
+        cached = cache.get_by_paths([h["entity"]["path"] for h in hits]) if cache is not None else {}
+        for i, hit in enumerate(hits):
+            vector = cached.get(hit["entity"]["path"])
+            if vector is not None: scores[i] = float(vector @ query)
+    else:
+        # فقط کاندیداهایی که فایلشان هست قابل امتیازدهی دوباره‌اند؛ تکه‌تکه تا حافظه محدود بماند
+        scorable = [i for i, h in enumerate(hits) if os.path.exists(h["entity"]["path"])]
+        for s in range(0, len(scorable), config.RERANK_BATCH_SIZE):
+            chunk = scorable[s : s + config.RERANK_BATCH_SIZE]
+            vectors = ai.get_embeddings(rescore_with, images=[hits[i]["entity"]["path"] for i in chunk])
+            for i, score in zip(chunk, vectors @ query):
+                scores[i] = float(score)
+    timings["candidate_vectors_ms"] = (time.perf_counter() - start) * 1000
+    timings["not_rescored"] = len(hits) - len(scores)
+
+    start = time.perf_counter()
+    reranked = [{**hit, "ann_distance": hit["distance"], "distance": scores[i]}
+                for i, hit in enumerate(hits) if i in scores]
+    if rescore_with == EXACT:
+        # کش‌نشده‌ها با همان امتیاز ANN (همان مدل، مقیاس کسینوسی) نمایش داده می‌شوند
+        reranked += [{**hit, "ann_distance": hit["distance"]} for i, hit in enumerate(hits) if i not in scores]
+    reranked.sort(key=lambda h: -h["distance"])
+    timings["rescore_ms"] = (time.perf_counter() - start) * 1000
+
+    if threshold is not None:
+        reranked = [h for h in reranked if h["distance"] >= threshold]
+    return reranked[:top_k], timings
@@ -0,0 +1,162 @@
+# core/text_index.py
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+import numpy as np
+import config
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# کلمات پرتکرار کپشن‌های BLIP که در امتیاز نقشی ندارند
+STOPWORDS = frozenset(
+    "a an the and or of in on at to with for from by is are was were be there this that its it "
+    "his her their some two three".split()
+)
+
+
+def tokenize(text):
+    """Lower-case word tokens without stopwords; a trailing plural "s" is dropped."""
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        if token in STOPWORDS: continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class CaptionIndex:
+    """In-memory BM25 inverted index over a collection's ``caption`` field.
+
+    Postings are stored CSR-style (``ptr`` / ``docs`` / ``tfs`` per term), so a
+    query only touches the posting lists of its own terms. Built by streaming
+    ``id, path, caption`` from Milvus and saved under ``TEXT_INDEX_DIR``;
+    ``for_collection`` rebuilds it when the collection's row count changes or
+    after ``invalidate`` (e.g. a caption backfill).
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    _indexes = {}       # collection_name -> CaptionIndex (بین rerun ها مشترک)
+    _stale = set()
+    _lock = threading.Lock()
+
+    def __init__(self, ids, paths, captions, doc_len, terms, ptr, docs, tfs, row_count):
+        self.ids = ids
+        self.paths = paths
+        self.captions = captions
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.ptr = ptr
+        self.docs = docs
+        self.tfs = tfs
+        self.row_count = row_count
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, batches):
+        """``batches`` yields dicts with ``id``, ``path``, ``caption`` arrays (``iter_collection``)."""
+        vocab, term_ids, docs, tfs = {}, [], [], []
+        ids, paths, captions, lengths = [], [], [], []
+        for batch in batches:
+            for row_id, path, caption in zip(batch["id"], batch["path"], batch["caption"]):
+                tokens = tokenize(caption)
+                doc = len(ids)
+                ids.append(int(row_id))
+                paths.append(path)
+                captions.append(caption or "")
+                lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    term_ids.append(vocab.setdefault(term, len(vocab)))
+                    docs.append(doc)
+                    tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=ptr[1:])
+        terms = sorted(vocab, key=vocab.get)
+        return cls(
+            np.asarray(ids, dtype=np.int64), np.asarray(paths, dtype=str), np.asarray(captions, dtype=str),
+            np.asarray(lengths, dtype=np.float32), terms, ptr,
+            np.asarray(docs, dtype=np.int32)[order], np.asarray(tfs, dtype=np.float32)[order], len(ids),
+        )
+
+    def search(self, query, top_k=10):
+        """BM25 top-k -> list of ``(id, score, path, caption)``, best first."""
+        if not len(self.ids): return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        n = len(self.ids)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None: continue
+            docs = self.docs[self.ptr[t] : self.ptr[t + 1]]
+            tf = self.tfs[self.ptr[t] : self.ptr[t + 1]]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / max(self.avgdl, 1e-9))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(self.ids[i]), float(scores[i]), str(self.paths[i]), str(self.captions[i])) for i in matched]
+
+    # --- ذخیره / بارگذاری ---
+    @staticmethod
+    def path_for(collection_name, root=None):
+        return os.path.join(root or config.TEXT_INDEX_DIR, f"{collection_name}.npz")
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, ids=self.ids, paths=self.paths, captions=self.captions, doc_len=self.doc_len,
+                 terms=np.asarray(self.terms, dtype=str), ptr=self.ptr, docs=self.docs, tfs=self.tfs,
+                 row_count=np.int64(self.row_count))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        index = cls(data["ids"], data["paths"], data["captions"], data["doc_len"], list(data["terms"]),
+                    data["ptr"], data["docs"], data["tfs"], int(data["row_count"]))
+        index.checked_at = float("-inf")  # نسخه دیسکی شاید قدیمی باشد؛ اولین بار حتماً شمارش شود
+        return index
+
+    @classmethod
+    def invalidate(cls, collection_name):
+        # مثلاً بعد از backfill کپشن‌ها؛ تعداد ردیف عوض نمی‌شود ولی متن عوض شده
+        with cls._lock:
+            cls._stale.add(collection_name)
+
+    @classmethod
+    def for_collection(cls, db, model_key, rebuild=False):
+        """Up-to-date index for ``model_key``'s collection (memory -> disk -> rebuild)."""
+        collection_name = config.MODELS_CONFIG[model_key]["collection_name"]
+        path = cls.path_for(collection_name)
+        with cls._lock:
+            index = cls._indexes.get(collection_name)
+            if index is None and not rebuild and os.path.exists(path):
+                index = cls.load(path)
+            stale = rebuild or index is None or collection_name in cls._stale
+            # شمارش ردیف‌ها حداکثر هر TEXT_INDEX_CHECK_TTL ثانیه یک بار
+            if not stale and time.monotonic() - index.checked_at > config.TEXT_INDEX_CHECK_TTL:
+                stale = db.count(model_key) != index.row_count
+                index.checked_at = time.monotonic()
+            if stale:
+                start = time.perf_counter()
+                index = cls.build(db.iter_collection(model_key, ("id", "path", "caption")))
+                index.save(path)
+                cls._stale.discard(collection_name)
+                print(f"🔤 Built caption index for '{collection_name}': {len(index)} rows, "
+                      f"{len(index.terms)} terms in {time.perf_counter() - start:.1f}s")
+            cls._indexes[collection_name] = index
+        return index
@@ -0,0 +1,163 @@
+# core/token_store.py
+import glob
+import json
+import os
+import re
+import threading
+import numpy as np
+import config
+
+
+class TokenStore:
+    """On-disk per-token (multi-vector) embeddings for late-interaction models.
+
+    Same layout idea as ``EmbeddingCache`` but each item owns a variable number
+    of rows::
+
+        shard_00000.npy    # (total_tokens, dim) int8 or float16
+        scale_00000.npy    # (total_tokens,) float32 per-token scale (int8 only)
+        index.jsonl        # {"h", "s", "o", "n"} -> rows o..o+n of shard s
+                           # {"p", "h"}           -> path p has content hash h
+    """
+
+    def __init__(self, name, root=None, dtype="int8", shard_rows=262144):
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "__", name)
+        self.dir = os.path.join(root or config.TOKEN_STORE_DIR, safe_name)
+        self.index_path = os.path.join(self.dir, "index.jsonl")
+        self.dtype = np.dtype(dtype)
+        self.shard_rows = shard_rows
+
+        self.locations = {}   # hash -> (shard, offset, n)
+        self.paths = {}       # path -> hash
+        self._shards = {}
+        self._scales = {}
+        self._pending = {}    # hash -> float32 (n, dim)
+        self._pending_paths = {}
+        self._pending_rows = 0
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path): return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "s" in row:
+                    self.locations[row["h"]] = (row["s"], row["o"], row["n"])
+                if "p" in row:
+                    self.paths[row["p"]] = row["h"]
+
+    def _file(self, kind, shard):
+        return os.path.join(self.dir, f"{kind}_{shard:05d}.npy")
+
+    def __contains__(self, h):
+        return h in self._pending or h in self.locations
+
+    @staticmethod
+    def quantize(tokens):
+        # int8 متقارن با scale جدا برای هر توکن
+        scale = np.abs(tokens).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        q = np.clip(np.rint(tokens / scale[:, None]), -127, 127).astype(np.int8)
+        return q, scale.astype(np.float32)
+
+    def _read(self, shard, offset, n):
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self._file("shard", shard), mmap_mode="r")
+            if self.dtype == np.int8:
+                self._scales[shard] = np.load(self._file("scale", shard), mmap_mode="r")
+        rows = np.asarray(self._shards[shard][offset : offset + n], dtype=np.float32)
+        if self.dtype == np.int8:
+            rows *= self._scales[shard][offset : offset + n, None]
+        return rows
+
+    def get_many(self, hashes):
+        found = {}
+        with self._lock:
+            for h in hashes:
+                if h in self._pending:
+                    found[h] = self._pending[h]
+                elif h in self.locations:
+                    found[h] = self._read(*self.locations[h])
+        return found
+
+    def get_by_paths(self, paths):
+        """``{path: (n, dim) float32}`` for the paths that have tokens stored."""
+        with self._lock:
+            hashes = {p: self._pending_paths.get(p) or self.paths.get(p) for p in paths}
+        found = self.get_many([h for h in hashes.values() if h])
+        return {p: found[h] for p, h in hashes.items() if h in found}
+
+    def __len__(self):
+        return len(self.locations) + len(self._pending)
+
+    def disk_bytes(self):
+        # حجم شاردها روی دیسک (برای گزارش در داشبورد)
+        return sum(os.path.getsize(f) for f in glob.glob(os.path.join(self.dir, "*.npy")))
+
+    def iter_by_paths(self, paths):
+        """Yield ``(path, (n, dim) float32)`` one path at a time, dequantized straight from the mmap shard.
+
+        Unlike ``get_by_paths`` only one item is materialised at a time.
+        """
+        with self._lock:
+            hashes = [(p, self._pending_paths.get(p) or self.paths.get(p)) for p in paths]
+        for p, h in hashes:
+            if not h: continue
+            with self._lock:
+                if h in self._pending:
+                    tokens = self._pending[h]
+                elif h in self.locations:
+                    tokens = self._read(*self.locations[h])
+                else:
+                    continue
+            yield p, tokens
+
+    def put_many(self, hashes, token_list, paths=None):
+        with self._lock:
+            for i, h in enumerate(hashes):
+                if h not in self:
+                    tokens = np.asarray(token_list[i], dtype=np.float32)
+                    self._pending[h] = tokens
+                    self._pending_rows += len(tokens)
+                if paths is not None and self.paths.get(paths[i]) != h:
+                    self._pending_paths[paths[i]] = h
+            if self._pending_rows >= self.shard_rows:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._pending_paths: return
+            os.makedirs(self.dir, exist_ok=True)
+            lines = []
+            if self._pending:
+                shard = len(glob.glob(os.path.join(self.dir, "shard_*.npy")))
+                hashes = list(self._pending)
+                matrix = np.concatenate([self._pending[h] for h in hashes])
+                if self.dtype == np.int8:
+                    matrix, scale = self.quantize(matrix)
+                    np.save(self._file("scale", shard), scale)
+                else:
+                    matrix = matrix.astype(self.dtype)
+                tmp_path = self._file("shard", shard) + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, matrix)
+                os.replace(tmp_path, self._file("shard", shard))
+                offset = 0
+                for h in hashes:
+                    n = len(self._pending[h])
+                    self.locations[h] = (shard, offset, n)
+                    lines.append({"h": h, "s": shard, "o": offset, "n": n})
+                    offset += n
+            for p, h in self._pending_paths.items():
+                self.paths[p] = h
+                lines.append({"p": p, "h": h})
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for row in lines:
+                    f.write(json.dumps(row) + "\n")
+            self._pending = {}
+            self._pending_paths = {}
+            self._pending_rows = 0
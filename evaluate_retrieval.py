@@ -0,0 +1,66 @@
+# evaluate_retrieval.py
+# ارزیابی text -> image روی کپشن‌های Flickr30k: recall@k با جستجوی دسته‌ای (search_many)
+#
+# مثال:
+#   python evaluate_retrieval.py "Jina CLIP v2" --limit 5000 --workers 4
+import argparse
+import csv
+import os
+import time
+import numpy as np
+import config
+from core.ai_engine import AIEngine
+from core.db_manager import DBManager
+
+
+def load_captions(path, limit=None):
+    """Flickr30k ``captions.txt`` (CSV with ``image,caption``) -> [(image filename, caption)]."""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            pairs.append((row["image"].strip(), row["caption"].strip()))
+            if limit and len(pairs) >= limit: break
+    return pairs
+
+
+def recall_at(hits, targets, ks):
+    # رتبه تصویر درست در نتایج هر کوئری (بر اساس نام فایل)
+    ranks = []
+    for result, target in zip(hits, targets):
+        names = [os.path.basename(h["entity"]["path"]) for h in result]
+        ranks.append(names.index(target) if target in names else None)
+    return {f"recall@{k}": round(sum(r is not None and r < k for r in ranks) / len(ranks), 4) for k in ks}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Text-to-image recall@k over Flickr30k captions.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("--captions", default=os.path.join(os.path.dirname(config.IMAGE_STORAGE_PATH), "captions.txt"))
+    parser.add_argument("--limit", type=int, default=None, help="max captions to evaluate")
+    parser.add_argument("-k", nargs="+", type=int, default=[1, 5, 10])
+    parser.add_argument("--embed-batch", type=int, default=64)
+    parser.add_argument("--search-batch", type=int, default=DBManager.SEARCH_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=2, help="search batches in flight")
+    args = parser.parse_args()
+
+    pairs = load_captions(args.captions, args.limit)
+    if not pairs:
+        raise SystemExit(f"❌ No captions in {args.captions}")
+    ai, db = AIEngine(), DBManager()
+
+    start = time.perf_counter()
+    texts = [caption for _, caption in pairs]
+    queries = np.concatenate([ai.get_embeddings(args.model, texts=texts[s : s + args.embed_batch])
+                              for s in range(0, len(texts), args.embed_batch)])
+    embed_s = time.perf_counter() - start
+    print(f"🧮 Embedded {len(texts)} captions in {embed_s:.1f}s")
+
+    start = time.perf_counter()
+    hits = db.search_many(
+        args.model, queries, top_k=max(args.k),
+        batch_size=args.search_batch, workers=args.workers,
+        progress=lambda done, total: print(f"   searched {done} / {total}...")
+    )
+    search_s = time.perf_counter() - start
+    print(f"🔍 {len(queries)} searches in {search_s:.1f}s ({len(queries) / search_s:.0f} QPS)")
+    print(recall_at(hits, [image for image, _ in pairs], args.k))
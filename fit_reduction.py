@@ -0,0 +1,43 @@
+# fit_reduction.py
+# یادگیری ماتریس PCA برای مدلی که در MODELS_CONFIG، "reduction": {"method": "pca", ...} دارد
+import argparse
+import numpy as np
+import config
+from core.embedding_cache import EmbeddingCache
+from core.reduction import Reducer
+
+
+def load_sample(model_key, source, sample_size, seed=0):
+    cfg = config.MODELS_CONFIG[model_key]
+    if source == "cache":
+        # کش همیشه بردار کامل مدل را نگه می‌دارد
+        cache = EmbeddingCache(cfg["model_id"])
+        parts = [v for _, v in cache.iter_batches(batch_size=4096, only_existing=False)]
+        vectors = np.concatenate(parts) if parts else np.empty((0, cfg["dimension"]), np.float32)
+    else:
+        from core.db_manager import DBManager
+        # فقط وقتی معنی دارد که کالکشن منبع هنوز بردار کامل ذخیره کرده باشد
+        vectors = DBManager().load_collection_arrays(model_key, fields=("vector",), limit=sample_size * 4)["vector"]
+        if vectors.ndim != 2 or vectors.shape[1] != cfg["dimension"]:
+            raise SystemExit("❌ Collection does not hold full-dimension vectors; use --source cache.")
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    return vectors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and save the PCA projection for a model.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("--source", choices=["cache", "milvus"], default="cache")
+    parser.add_argument("--sample", type=int, default=20000)
+    args = parser.parse_args()
+
+    reducer = Reducer(args.model)
+    if reducer.method != "pca":
+        raise SystemExit(f"❌ MODELS_CONFIG['{args.model}'] has no PCA reduction configured.")
+
+    sample = load_sample(args.model, args.source, args.sample)
+    print(f"📐 Fitting PCA {sample.shape[1]} -> {reducer.dim} on {len(sample)} vectors...")
+    explained = reducer.fit(sample)
+    print(f"✅ Saved {reducer.path} (explained variance: {explained:.1%})")
@@ -0,0 +1,31 @@
+# migrate_collection.py
+# تبدیل یک کالکشن موجود به فرمت ذخیره دیگر (float16 / int8 / binary) بدون اجرای مدل
+# با همان فرمت هم کاربرد دارد: کالکشن قدیمی را به schema جدید (فیلدهای filename/directory/... با ایندکس) می‌برد
+import argparse
+import config
+from core.db_manager import DBManager, STORAGE_FORMATS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy a collection into a new vector storage format.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("format", choices=list(STORAGE_FORMATS))
+    parser.add_argument("--target", help="target collection name (default: <collection>_<format>)")
+    parser.add_argument("--index", help="index type for the new collection, e.g. IVF_PQ / HNSW / BIN_IVF_FLAT")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = DBManager()
+    index = None
+    if args.index:
+        index_type = args.index.upper()
+        index = (index_type, dict(config.INDEX_BUILD_DEFAULTS.get(index_type, {})))
+
+    source = config.MODELS_CONFIG[args.model]["collection_name"]
+    print(f"🔁 Migrating '{source}' ({db.live_storage_format(args.model)}) -> {args.format}...")
+    target, copied = db.migrate_collection(
+        args.model, args.format, target_collection=args.target, index=index,
+        batch_size=args.batch_size, progress=lambda n: print(f"   copied {n} rows...")
+    )
+    print(f"🎉 Copied {copied} rows into '{target}'.")
+    print(f"👉 Update MODELS_CONFIG['{args.model}']: collection_name='{target}', storage='{args.format}'.")
@@ -2,6 +2,9 @@
 import streamlit as st
 import os
 from core.db_manager import DBManager
+from core.dedup import find_duplicate_clusters, similarity_to_first
+from core.link_scanner import scan_links
+from core.manifest import IndexManifest
 import config  # 👈 اضافه شد برای دسترسی به لیست مدل‌ها
 
 st.set_page_config(page_title="Cleanup", page_icon="🧹")
@@ -31,55 +34,66 @@ tab1, tab2 = st.tabs(["Deduplication (تکراری‌ها)", "Broken Links (فا
 # ==========================================
 with tab1:
     st.markdown(f"### 1. Remove Duplicate Vectors in **{selected_model}**")
-    st.info("Logic: If paths are identical, only remove DB record. If files are different copies, remove file too.")
+    st.info("Logic: each duplicate is compared directly with the kept original; members that only matched "
+            "through another duplicate are kept. Records are removed from the DB. Files on disk are deleted "
+            "only for exact copies (identical vector, different path), unless you opt in below.")
+
+    # 1.0 یعنی فقط بردارهای دقیقاً یکسان؛ کمتر از آن نسخه‌های resize/re-encode شده را هم پیدا می‌کند
+    dup_threshold = st.slider("Near-duplicate cosine threshold:", 0.90, 1.0, 0.99, 0.005)
+    delete_near_files = st.checkbox("Also delete near-duplicate files from disk (not only exact copies)", value=False)
 
     if st.button("🔍 Scan for Duplicates"):
         with st.spinner(f"Scanning collection {target_collection}..."):
-            # 👇 ارسال مدل انتخابی به تابع get_all_data
-            all_data = db.get_all_data(model_key=selected_model, limit=16000)
-            
-            unique_vectors = {}  # {vector_tuple: {'id': id, 'path': path}}
+            # 👇 خواندن کل کالکشن به صورت دسته‌ای (بدون سقف 16000)
+            data = db.load_collection_arrays(model_key=selected_model, fields=("id", "vector", "path"))
             duplicates = []      # List of items to delete
             
-            if not all_data:
+            if not len(data["id"]):
                 st.warning("Database is empty or connection failed.")
             else:
-                for item in all_data:
-                    # تبدیل لیست بردار به تاپل برای قابل هش شدن
-                    vec_signature = tuple(item['vector'])
-                    
-                    if vec_signature in unique_vectors:
-                        # تکراری پیدا شد!
-                        original = unique_vectors[vec_signature]
-                        
+                # همه بردارها در یک ماتریس نامپای؛ مقایسه به صورت بلوکی
+                scan_bar = st.progress(0.0)
+                clusters = find_duplicate_clusters(data["vector"], threshold=dup_threshold, progress=scan_bar.progress)
+
+                for cluster in clusters:
+                    # اولین عضو خوشه (قدیمی‌ترین) اصلی است
+                    orig = cluster[0]
+                    # خوشه‌ها تعدی‌اند (A~B و B~C)؛ هر عضو مستقیم با اصلی مقایسه می‌شود
+                    sims = similarity_to_first(data["vector"], cluster)
+                    for idx, sim in zip(cluster[1:], sims[1:]):
+                        if sim < dup_threshold - 1e-6: continue
                         # بررسی می‌کنیم آیا فایل فیزیکی‌شان هم یکی است؟
-                        is_same_file = (original['path'] == item['path'])
-                        
+                        is_same_file = (data["path"][orig] == data["path"][idx])
                         duplicates.append({
-                            'id': item['id'],
-                            'path': item['path'],
+                            'id': int(data["id"][idx]),
+                            'path': data["path"][idx],
                             'is_same_file': is_same_file,
-                            'original_id': original['id']
+                            'similarity': float(sim),
+                            'exact': bool(sim >= 1 - 1e-6),
+                            'original_id': int(data["id"][orig]),
+                            'original_path': data["path"][orig]
                         })
-                    else:
-                        # اولین بار است می‌بینیم (اصلی)
-                        unique_vectors[vec_signature] = {'id': item['id'], 'path': item['path']}
 
                 st.session_state['duplicates'] = duplicates
+                st.session_state['duplicate_clusters'] = len(clusters)
                 
                 if not duplicates:
                     st.success("✨ No duplicates found.")
                 else:
-                    st.warning(f"⚠️ Found {len(duplicates)} duplicates.")
+                    st.warning(f"⚠️ Found {len(duplicates)} duplicates in {len(clusters)} clusters.")
 
     # نمایش و حذف
     if 'duplicates' in st.session_state and st.session_state['duplicates']:
         dups = st.session_state['duplicates']
+
+        def removes_file(item):
+            # فایل جدا فقط برای کپی دقیق حذف می‌شود (یا با انتخاب صریح کاربر برای near-duplicate)
+            return not item['is_same_file'] and (item['exact'] or delete_near_files)
         
         with st.expander("Show Details"):
             for d in dups[:10]:
-                action = "Database Only" if d['is_same_file'] else "Disk & Database"
-                st.write(f"🗑️ ID: {d['id']} | Action: {action} | Path: {d['path']}")
+                action = "Disk & Database" if removes_file(d) else "Database Only"
+                st.write(f"🗑️ ID: {d['id']} | cos {d['similarity']:.4f} | Action: {action} | Path: {d['path']} | Kept: {d['original_path']}")
 
         if st.button("🚀 Confirm Delete"):
             progress_bar = st.progress(0)
@@ -87,8 +101,8 @@ with tab1:
             files_removed = 0
             
             for i, item in enumerate(dups):
-                # 1. حذف فایل فیزیکی (فقط اگر فایل‌ها جداگانه باشند)
-                if not item['is_same_file']:
+                # 1. حذف فایل فیزیکی (فقط فایل جدا و کپی دقیق، مگر کاربر near-duplicate را هم خواسته باشد)
+                if removes_file(item):
                     try:
                         if os.path.exists(item['path']):
                             os.remove(item['path'])
@@ -100,10 +114,18 @@ with tab1:
                 deleted_ids.append(item['id'])
                 progress_bar.progress((i + 1) / len(dups))
             
-            # 👇 ارسال مدل انتخابی برای حذف
-            db.delete_by_ids(model_key=selected_model, id_list=deleted_ids)
+            # 👇 حذف دسته‌ای و موازی از دیتابیس
+            delete_bar = st.progress(0.0)
+            report = db.bulk_delete(
+                model_key=selected_model, id_list=deleted_ids,
+                progress=lambda done, total: delete_bar.progress(done / total)
+            )
+            removed = sum(chunk['deleted'] for chunk in report)
+            failed = [chunk for chunk in report if chunk['error']]
             
-            st.success(f"Done! Removed {len(deleted_ids)} records from {target_collection} and {files_removed} files from disk.")
+            st.success(f"Done! Removed {removed} records from {target_collection} and {files_removed} files from disk.")
+            if failed:
+                st.error(f"❌ {len(failed)} of {len(report)} delete chunks failed: {failed[0]['error']}")
             del st.session_state['duplicates']
 
 # ==========================================
@@ -111,27 +133,38 @@ with tab1:
 # ==========================================
 with tab2:
     st.markdown(f"### 2. Fix Broken Links in **{selected_model}**")
-    st.markdown("Finds records in Milvus where the image file is missing from disk.")
+    st.markdown("Finds records in Milvus where the image file is missing from disk, and image files on disk that are not indexed.")
+    scan_workers = st.slider("Directory listing threads:", 1, 64, 16)
     
     if st.button("🕵️ Scan for Missing Files"):
         with st.spinner("Checking file system..."):
-            # 👇 ارسال مدل انتخابی
-            all_data = db.get_all_data(model_key=selected_model, limit=16000)
-            broken_links = []
-            
-            if not all_data:
+            # 👇 فقط id و path خوانده می‌شود؛ هر پوشه یک بار با os.scandir
+            scan_bar = st.progress(0.0)
+            report = scan_links(
+                db.iter_collection(model_key=selected_model, fields=("id", "path")),
+                workers=scan_workers,
+                progress=scan_bar.progress
+            )
+            broken_links = report["orphaned_records"]
+
+            if not report["records"]:
                 st.warning("Database is empty.")
             else:
-                for item in all_data:
-                    if not os.path.exists(item['path']):
-                        broken_links.append(item)
-                
                 st.session_state['broken_links'] = broken_links
+                st.session_state['orphaned_files'] = report["orphaned_files"]
+                st.caption(f"Checked {report['records']} records in {report['directories']} directories.")
                 
                 if broken_links:
                     st.error(f"❌ Found {len(broken_links)} records with missing files.")
                 else:
                     st.success("✅ All database records point to valid files.")
+                if report["orphaned_files"]:
+                    st.warning(f"📂 Found {len(report['orphaned_files'])} image files on disk that are not indexed.")
+
+    if st.session_state.get('orphaned_files'):
+        with st.expander("View Unindexed Files"):
+            for f in st.session_state['orphaned_files'][:500]:
+                st.code(f)
 
     if 'broken_links' in st.session_state and st.session_state['broken_links']:
         broken = st.session_state['broken_links']
@@ -142,8 +175,19 @@ with tab2:
         
         if st.button("🧹 Clean Broken Records from DB"):
             ids_to_remove = [item['id'] for item in broken]
-            # 👇 ارسال مدل انتخابی برای حذف
-            db.delete_by_ids(model_key=selected_model, id_list=ids_to_remove)
+            # 👇 حذف دسته‌ای و موازی از دیتابیس
+            delete_bar = st.progress(0.0)
+            report = db.bulk_delete(
+                model_key=selected_model, id_list=ids_to_remove,
+                progress=lambda done, total: delete_bar.progress(done / total)
+            )
+            removed = sum(chunk['deleted'] for chunk in report)
+            failed = [chunk for chunk in report if chunk['error']]
+            # فایل‌های حذف‌شده از manifest حالت افزایشی هم پاک شوند
+            if not failed:
+                IndexManifest(target_collection).forget([item['path'] for item in broken])
             
-            st.success(f"Removed {len(ids_to_remove)} broken records form {target_collection}.")
+            st.success(f"Removed {removed} broken records form {target_collection}.")
+            if failed:
+                st.error(f"❌ {len(failed)} of {len(report)} delete chunks failed: {failed[0]['error']}")
             del st.session_state['broken_links']
\ No newline at end of file
@@ -4,6 +4,7 @@ import os
 from PIL import Image
 from core.ai_engine import AIEngine
 from core.db_manager import DBManager
+from core.manifest import IndexManifest
 import config
 
 st.set_page_config(page_title="Insert Data", page_icon="📥")
@@ -56,14 +57,26 @@ if uploaded_file:
                 # 1. کپشن
                 if caption_mode == "Auto Caption 🤖":
                     st.info("🤖 AI is generating caption...")
-                    final_caption = ai.generate_caption(save_path)
-                    st.success(f"Generated Caption: **{final_caption}**")
+                    try:
+                        final_caption = ai.generate_caption(save_path)
+                        st.success(f"Generated Caption: **{final_caption}**")
+                    except Exception as e:
+                        # تصویر بدون کپشن ذخیره می‌شود؛ backfill_captions.py بعداً تکمیلش می‌کند
+                        st.warning(f"⚠️ Caption failed ({e}); saving without a caption.")
                 
-                # 2. تولید بردار (با مدل انتخابی)
-                vector = ai.get_embedding(model_key=selected_model, image=save_path)
+                # 2. تولید بردار (با مدل انتخابی، از مسیر بچ)
+                vector = ai.get_embeddings(model_key=selected_model, images=[save_path])[0]
                 
-                # 3. ذخیره در دیتابیس
-                db.insert_image(model_key=selected_model, vector=vector, path=save_path, caption=final_caption)
+                # 3. ذخیره در دیتابیس + ثبت در manifest تا ایندکس دسته‌ای بعدی دوباره اینسرتش نکند
+                manifest = IndexManifest(target_collection)
+                # sync قبل از اولین record: وگرنه manifest غیرخالی می‌شود و دیگر از کالکشن پر نمی‌شود
+                manifest.sync(db, selected_model)
+                _, stale_ids, _ = manifest.plan([save_path])
+                if stale_ids:
+                    # همان نام فایل قبلاً آپلود شده و حالا بازنویسی شد؛ ردیف قدیمی حذف شود
+                    db.delete_by_ids(selected_model, stale_ids)
+                res = db.insert_image(model_key=selected_model, vector=vector, path=save_path, caption=final_caption)
+                manifest.record([save_path], list(res["ids"]) if res and "ids" in res else None)
                 
                 st.balloons()
                 st.success(f"✅ Saved to `{target_collection}` successfully!")
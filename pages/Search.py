@@ -4,6 +4,13 @@ from PIL import Image
 from streamlit_cropper import st_cropper 
 from core.ai_engine import AIEngine
 from core.db_manager import DBManager
+from core.late_interaction import late_interaction_search
+from core.rerank import EXACT, two_stage_search
+from core.hybrid import hybrid_search
+from core.federated import federated_search
+from core.text_index import CaptionIndex
+from core.filters import build_filter
+import datetime
 import os
 import config
 
@@ -17,6 +24,8 @@ except Exception as e:
     st.error(f"System Error: {e}")
     st.stop()
 
+ai.preload()
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("Search Configuration")
@@ -34,15 +43,58 @@ with st.sidebar:
     
     search_type = st.radio(
         "Select Mode:", 
-        ["Text Search 📝", "Image Search 🖼️", "Crop & Search ✂️", "Hybrid Search 🌪️"]
+        ["Text Search 📝", "Image Search 🖼️", "Crop & Search ✂️", "Hybrid Search 🌪️", "Federated Search 🌐"]
     )
     
     st.markdown("---")
     top_k = st.slider("Max Results:", 1, 50, 12)
     threshold = st.slider("Similarity Threshold:", 0.0, 1.0, 0.25, 0.01)
 
+    # پارامتر زمان جستجو متناسب با نوع ایندکس کالکشن
+    index_type = db.live_index_type(selected_model)
+    default_params = config.INDEX_SEARCH_DEFAULTS.get(index_type, {})
+    query_params = {}
+    if index_type == "HNSW":
+        query_params["ef"] = st.slider("HNSW ef:", 16, 512, default_params.get("ef", 64), 16)
+    elif "IVF" in index_type:
+        nlist = db.index_config(selected_model)[1].get("nlist", 1024)
+        query_params["nprobe"] = st.slider(f"{index_type} nprobe:", 1, nlist, min(default_params.get("nprobe", 16), nlist))
+    elif index_type == "DISKANN":
+        query_params["search_list"] = st.slider("DiskANN search_list:", 16, 1000, default_params.get("search_list", 100), 8)
+    storage_fmt = db.live_storage_format(selected_model)
+    st.caption(f"Index: `{index_type}` ({storage_fmt}) — higher values trade latency for recall.")
+
+    # استراتژی بازیابی مدل (late interaction = کاندیدا با بردار میانگین + MaxSim)
+    retrieval_cfg = ai.retrieval_config(selected_model)
+    late_interaction = False
+    if retrieval_cfg["strategy"] == "late_interaction":
+        late_interaction = st.checkbox("Late-interaction re-rank (MaxSim)", value=True)
+        li_candidates = st.slider("MaxSim candidates:", 20, 500, retrieval_cfg["candidates"], 10)
+
+    # جستجوی دو مرحله‌ای: کاندیدا از ایندکس فشرده، امتیاز دقیق با بردار کامل یا مدل دوم
+    two_stage = False
+    if not late_interaction:
+        # بردارهای باینری فقط فیلتر اولیه‌اند؛ re-rank دقیق پیش‌فرض روشن است
+        two_stage = st.checkbox("Two-stage exact re-rank", value=(storage_fmt == "binary"))
+        if two_stage:
+            rescore_options = [EXACT] + [m for m in model_options if m != selected_model]
+            rescore_with = st.selectbox(
+                "Re-score with:", rescore_options,
+                format_func=lambda m: "Exact (full-precision cache)" if m == EXACT else m
+            )
+            rerank_candidates = st.slider("Re-rank candidates:", 20, 500, config.RERANK_CANDIDATES, 10)
+
+    # جستجوی بازه‌ای: آستانه سمت سرور اعمال می‌شود و همه نتایج بالای آن برمی‌گردد
+    range_mode = st.checkbox("Server-side Range Search", value=False)
+    if range_mode:
+        range_cap = st.number_input("Max Range Hits:", 50, db.MAX_SEARCH_WINDOW, 1000, step=50)
+        st.caption("`Max Results` is used as the page size.")
+
 query_vector = None
+query_input = {}   # ورودی خام کوئری (text یا image) برای مراحل بعدی مثل re-rank
 milvus_filter = None 
+keyword_query = None  # متن BM25 روی کپشن‌ها (فقط در Hybrid)
+federated_models = []  # مدل‌های جستجوی هم‌زمان (فقط در Federated)
 
 # --- LOGIC ---
 if search_type == "Text Search 📝":
@@ -51,6 +103,7 @@ if search_type == "Text Search 📝":
     if query:
         with st.spinner("Embedding text..."):
             query_vector = ai.get_embedding(model_key=selected_model, text=query)
+            query_input = {"text": query}
 
 elif search_type == "Image Search 🖼️":
     st.subheader(f"Image-to-Image Search ({selected_model})")
@@ -61,6 +114,7 @@ elif search_type == "Image Search 🖼️":
         if st.button("🔍 Search"):
             with st.spinner("Embedding image..."):
                 query_vector = ai.get_embedding(model_key=selected_model, image=image)
+                query_input = {"image": image}
 
 elif search_type == "Crop & Search ✂️":
     st.subheader("Object Search (Crop)")
@@ -75,6 +129,7 @@ elif search_type == "Crop & Search ✂️":
             if st.button("🔍 Search Object"):
                 with st.spinner("Embedding object..."):
                     query_vector = ai.get_embedding(model_key=selected_model, image=cropped_img)
+                    query_input = {"image": cropped_img}
 
 elif search_type == "Hybrid Search 🌪️":
     st.subheader("Hybrid Search (Vector + Metadata)")
@@ -86,40 +141,180 @@ elif search_type == "Hybrid Search 🌪️":
             h_text = st.text_input("Query:", key="h_text")
             if h_text:
                 query_vector = ai.get_embedding(model_key=selected_model, text=h_text)
+                query_input = {"text": h_text}
         else:
             h_img = st.file_uploader("Image:", type=['jpg', 'png'], key="h_img")
             if h_img:
                 img_obj = Image.open(h_img).convert("RGB")
                 st.image(img_obj, width=150)
                 query_vector = ai.get_embedding(model_key=selected_model, image=img_obj)
+                query_input = {"image": img_obj}
 
     with col_filter:
         st.markdown("### 2. Hard Filter")
-        filter_text = st.text_input("Filename pattern:")
-        if filter_text:
-            milvus_filter = f"path like '%{filter_text}%'"
+        # فیلدهای اسکالر ایندکس‌شده؛ مقادیر همیشه quote می‌شوند (بدون تزریق در عبارت)
+        indexed = db.has_metadata_fields(selected_model)
+        # کالکشن قدیمی فیلد filename ندارد و پیشوند نام فایل روی path دقیق نیست
+        filename_prefix = st.text_input("Filename starts with:", disabled=not indexed)
+        directory_prefix = st.text_input("Directory starts with:")
+        extensions = st.multiselect("Extensions:", ["jpg", "jpeg", "png"])
+        ingested_range = None
+        if indexed and st.checkbox("Filter by ingestion date"):
+            today = datetime.date.today()
+            ingested_range = st.date_input("Ingested between:", (today - datetime.timedelta(days=30), today))
+        after = before = None
+        if ingested_range and len(ingested_range) == 2:
+            after = datetime.datetime.combine(ingested_range[0], datetime.time.min).timestamp()
+            before = datetime.datetime.combine(ingested_range[1] + datetime.timedelta(days=1), datetime.time.min).timestamp()
+        milvus_filter = build_filter(
+            filename_prefix=(filename_prefix or None) if indexed else None,
+            directory_prefix=directory_prefix or None,
+            extensions=extensions or None,
+            ingested_after=after,
+            ingested_before=before,
+            indexed=indexed,
+        )
+        if milvus_filter:
             st.code(f"Filter: {milvus_filter}", language="sql")
+        if not indexed:
+            st.caption("⚠️ This collection predates the indexed metadata fields; filters fall back to "
+                       "`path` scans and the filename filter is off. Run `migrate_collection.py` with the "
+                       "same format to upgrade it.")
+
+        st.markdown("### 3. Caption Keywords (BM25)")
+        if st.checkbox("Fuse with caption keyword search", value=True):
+            default_keywords = h_text if hybrid_mode == "Text" and h_text else ""
+            keyword_query = st.text_input("Keywords:", value=default_keywords, key="h_kw") or None
+            fusion_mode = st.radio("Fusion:", ["RRF", "Weighted"], horizontal=True)
+            fusion_alpha = st.slider("Vector weight (0 = keywords only):", 0.0, 1.0, 0.5, 0.05)
+            if st.button("🔄 Rebuild caption index"):
+                with st.spinner("Indexing captions..."):
+                    CaptionIndex.for_collection(db, selected_model, rebuild=True)
+
+elif search_type == "Federated Search 🌐":
+    st.subheader("Federated Search (all models)")
+    col_input, col_models = st.columns(2)
+    with col_models:
+        # پیش‌فرض: مدل انتخابی + مدل‌های دارای داده که الان در حافظه‌اند (همه با هم از سقف حافظه بیشترند)
+        populated = [m for m in model_options if db.count(m) > 0]
+        default_models = [m for m in populated if m == selected_model or ai.is_loaded(m)]
+        federated_models = st.multiselect("Models:", model_options, default=default_models or [selected_model])
+        st.caption("Models are loaded one at a time; selecting more than fit in the memory budget "
+                   "means reloading some of them on every query.")
+        fed_norm = st.radio("Score calibration:", ["Z-score", "Min-max", "RRF"], horizontal=True)
+        fed_candidates = st.slider("Candidates per model:", 10, 500, 50, 10)
+        st.caption("Raw cosines are not comparable across models, so the threshold slider is not applied; "
+                   "scores are calibrated per model, then merged by image path.")
+    with col_input:
+        fed_mode = st.radio("Input Type:", ["Text", "Image"], horizontal=True, key="fed_mode")
+        if fed_mode == "Text":
+            f_text = st.text_input("Query:", key="f_text")
+            if f_text:
+                query_input = {"text": f_text}
+        else:
+            f_img = st.file_uploader("Image:", type=['jpg', 'png', 'jpeg'], key="f_img")
+            if f_img:
+                img_obj = Image.open(f_img).convert("RGB")
+                st.image(img_obj, width=150)
+                query_input = {"image": img_obj}
+
+# --- آمار کش امبدینگ کوئری ---
+with st.sidebar:
+    qc = ai.query_cache_stats()
+    st.caption(f"🧠 Query cache: {qc['hits']} hits / {qc['misses']} misses ({qc['hit_rate']:.0%}), {qc['size']}/{qc['maxsize']} entries")
+    _, mem = ai.model_memory_stats()
+    st.caption(f"💾 Models in memory: {mem['resident_mb']:.0f} MB" + (f" / {mem['budget_mb']:.0f} MB" if mem["budget_mb"] else ""))
 
 # --- RESULTS ---
-if query_vector is not None:
+if query_vector is not None or (federated_models and query_input):
     st.divider()
     if search_type == "Hybrid Search 🌪️" and not st.button("🚀 Run Search"): st.stop()
 
     st.subheader("Results")
-    with st.spinner(f"Searching in collection: {config.MODELS_CONFIG[selected_model]['collection_name']}..."):
-        raw_results = db.search(
-            model_key=selected_model, 
-            vector=query_vector, 
-            top_k=top_k, 
-            filter_expr=milvus_filter
-        )
-    
-    valid_results = [res for res in raw_results if res['distance'] >= threshold]
+    searching = f"{len(federated_models)} collections" if federated_models else config.MODELS_CONFIG[selected_model]['collection_name']
+    with st.spinner(f"Searching in: {searching}..."):
+        if federated_models:
+            valid_results, fed_report = federated_search(
+                ai, db, federated_models, query_input,
+                top_k=top_k,
+                candidates=fed_candidates,
+                normalization={"Z-score": "zscore", "Min-max": "minmax", "RRF": "rrf"}[fed_norm],
+                query_params={selected_model: query_params}
+            )
+            st.caption(" | ".join(
+                f"{m}: " + (f"⚠️ {r['error']}" if "error" in r else f"{r['embed_ms']:.0f}+{r['search_ms']:.0f} ms")
+                for m, r in fed_report.items() if m != "total"
+            ) + f" | wall: {fed_report['total']['wall_ms']:.0f} ms")
+            range_mode = False
+        elif keyword_query and not range_mode:
+            valid_results, hybrid_timings = hybrid_search(
+                db, CaptionIndex.for_collection(db, selected_model), selected_model,
+                query_vector, keyword_query,
+                top_k=top_k,
+                fusion="rrf" if fusion_mode == "RRF" else "weighted",
+                alpha=fusion_alpha,
+                filter_expr=milvus_filter,
+                threshold=threshold,
+                query_params=query_params
+            )
+            st.caption(" | ".join(f"{k}: {v:.1f}" for k, v in hybrid_timings.items()))
+        elif late_interaction and not range_mode:
+            query_tokens = ai.get_query_tokens(selected_model, **query_input)
+            valid_results, li_timings = late_interaction_search(
+                db, ai.token_store(selected_model), selected_model,
+                query_vector, query_tokens,
+                top_k=top_k,
+                candidates=li_candidates,
+                filter_expr=milvus_filter,
+                threshold=threshold,
+                query_params=query_params
+            )
+            st.caption(" | ".join(f"{k}: {v:.1f}" for k, v in li_timings.items()))
+        elif two_stage and not range_mode:
+            valid_results, rerank_timings = two_stage_search(
+                ai, db, selected_model, query_vector, query_input,
+                top_k=top_k,
+                candidates=rerank_candidates,
+                rescore_with=rescore_with,
+                filter_expr=milvus_filter,
+                threshold=threshold,
+                query_params=query_params
+            )
+            st.caption(" | ".join(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}" for k, v in rerank_timings.items()))
+            if rescore_with == EXACT and rerank_timings["not_rescored"]:
+                st.caption(f"ℹ️ {rerank_timings['not_rescored']} candidates are not in the embedding cache "
+                           "and keep their ANN score (re-index or rebuild the cache to re-score them).")
+        elif range_mode:
+            all_results = db.range_search_cached(
+                model_key=selected_model,
+                vector=query_vector,
+                threshold=threshold,
+                cap=int(range_cap),
+                filter_expr=milvus_filter,
+                query_params=query_params
+            )
+        else:
+            # تغییر اسلایدرها فقط از کش جواب داده می‌شود (بدون رفت‌وبرگشت به Milvus)
+            valid_results = db.search_cached(
+                model_key=selected_model, 
+                vector=query_vector, 
+                top_k=top_k, 
+                filter_expr=milvus_filter,
+                threshold=threshold,
+                query_params=query_params
+            )
+
+    page_note = ""
+    if range_mode:
+        num_pages = max(1, -(-len(all_results) // top_k))
+        page = st.number_input("Page:", 1, num_pages, 1) if num_pages > 1 else 1
+        valid_results = all_results[(page - 1) * top_k : page * top_k]
+        page_note = f" (page {page}/{num_pages}, {len(all_results)} total)"
             
     if not valid_results:
-        st.warning(f"🚫 No results found above threshold {threshold}.")
+        st.warning("🚫 No results found." if federated_models else f"🚫 No results found above threshold {threshold}.")
     else:
-        st.success(f"Found {len(valid_results)} matches.")
+        st.success(f"Found {len(valid_results)} matches{page_note}.")
         cols = st.columns(4)
         for i, res in enumerate(valid_results):
             score = res['distance']
@@ -131,6 +326,12 @@ if query_vector is not None:
                 color = "green" if score > 0.6 else "orange"
                 st.markdown(f"**{filename}**")
                 st.caption(f":{color}[Score: {score:.4f}]")
+                if "bm25" in res:
+                    cos = "-" if res["vector_distance"] is None else f"{res['vector_distance']:.3f}"
+                    bm25 = "-" if res["bm25"] is None else f"{res['bm25']:.2f}"
+                    st.caption(f"cos {cos} · bm25 {bm25}")
+                if "sources" in res:
+                    st.caption(" · ".join(f"{m} {s:.3f}" for m, s in res["sources"].items()))
                 if os.path.exists(path):
                     st.image(path, use_container_width=True)
                     if caption: st.info(f"📄 {caption[:40]}...")
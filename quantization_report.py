@@ -0,0 +1,108 @@
+# quantization_report.py
+# گزارش حافظه صرفه‌جویی‌شده در برابر افت recall برای فرمت‌های ذخیره/کوانتیزه
+#
+#   python quantization_report.py --model "Llama-Nemo-3B" --source milvus
+#   python quantization_report.py --source random --dim 3072     (آفلاین)
+import argparse
+import numpy as np
+import config
+from benchmark_index import load_vectors, split_queries, ground_truth
+from core.db_manager import DBManager, STORAGE_BYTES_PER_DIM
+
+
+def topk(scores, k):
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall(found, gt):
+    k = gt.shape[1]
+    return float(np.mean([len(np.intersect1d(f[:k], g)) / k for f, g in zip(found, gt)]))
+
+
+def train_pq(x, m, nbits=8, iters=8, seed=0):
+    """Plain k-means per sub-space; returns codebooks (m, 2**nbits, dim/m)."""
+    rng = np.random.default_rng(seed)
+    sub = x.shape[1] // m
+    k = 2 ** nbits
+    sample = x[rng.choice(len(x), min(len(x), k * 40), replace=False)]
+    books = np.empty((m, k, sub), dtype=np.float32)
+    for j in range(m):
+        part = sample[:, j * sub : (j + 1) * sub]
+        cent = part[rng.choice(len(part), k, replace=False)].copy()
+        for _ in range(iters):
+            d = (part ** 2).sum(1)[:, None] - 2 * part @ cent.T + (cent ** 2).sum(1)[None, :]
+            assign = d.argmin(1)
+            for c in range(k):
+                members = part[assign == c]
+                if len(members): cent[c] = members.mean(0)
+        books[j] = cent
+    return books
+
+
+def pq_scores(base, queries, books):
+    # ADC: جدول ضرب داخلی کوئری با مراکز هر زیرفضا
+    m, k, sub = books.shape
+    codes = np.empty((len(base), m), dtype=np.int64)
+    for j in range(m):
+        part = base[:, j * sub : (j + 1) * sub]
+        d = (part ** 2).sum(1)[:, None] - 2 * part @ books[j].T + (books[j] ** 2).sum(1)[None, :]
+        codes[:, j] = d.argmin(1)
+    scores = np.zeros((len(queries), len(base)), dtype=np.float32)
+    for j in range(m):
+        table = queries[:, j * sub : (j + 1) * sub] @ books[j].T      # (Q, k)
+        scores += table[:, codes[:, j]]
+    return scores
+
+
+def report(base, queries, k=10, pq_m=16, rerank=100):
+    dim = base.shape[1]
+    gt = ground_truth(base, queries, k)
+    rows = []
+
+    def add(name, bytes_per_vec, found):
+        rows.append({
+            "format": name,
+            "bytes/vec": round(bytes_per_vec, 1),
+            "saved_vs_fp32": f"{1 - bytes_per_vec / (4 * dim):.1%}",
+            "total_MB": round(bytes_per_vec * len(base) / 2**20, 1),
+            f"recall@{k}": round(recall(found, gt), 4),
+        })
+
+    add("float32", 4 * dim, gt)
+    for fmt in ("float16", "int8", "binary"):
+        enc = DBManager.decode_vectors(fmt, DBManager.encode_vectors(fmt, base), dim)
+        q = queries if fmt != "binary" else DBManager.decode_vectors(fmt, DBManager.encode_vectors(fmt, queries), dim)
+        scores = q @ enc.T
+        add(fmt, STORAGE_BYTES_PER_DIM[fmt] * dim, topk(scores, k))
+        if fmt == "binary":
+            # پیش‌فیلتر Hamming و سپس امتیاز دقیق روی rerank کاندیدا
+            cand = topk(scores, rerank)
+            exact = np.einsum("qd,qcd->qc", queries, base[cand])
+            add(f"binary + exact re-rank@{rerank}", STORAGE_BYTES_PER_DIM[fmt] * dim,
+                np.take_along_axis(cand, np.argsort(-exact, axis=1), axis=1))
+
+    if dim % pq_m == 0:
+        books = train_pq(base, pq_m)
+        add(f"PQ m={pq_m} nbits=8", pq_m, topk(pq_scores(base, queries, books), k))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory saved vs recall lost for vector storage formats.")
+    parser.add_argument("--model", choices=list(config.MODELS_CONFIG.keys()), default="SigLIP")
+    parser.add_argument("--source", choices=["milvus", "cache", "random"], default="random")
+    parser.add_argument("--limit", type=int, default=50000)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, default=16)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.source, args.model, limit=args.limit, n=args.n, dim=args.dim)
+    base, queries = split_queries(vectors, args.queries)
+    print(f"📊 base={base.shape} queries={queries.shape}")
+    for row in report(base, queries, k=args.k, pq_m=args.pq_m):
+        print(row)
@@ -0,0 +1,50 @@
+# rebuild_from_cache.py
+# بازسازی یک کالکشن Milvus فقط از روی کش امبدینگ (بدون اجرای مدل)
+import argparse
+import config
+from core.db_manager import DBManager
+from core.embedding_cache import EmbeddingCache
+from core.manifest import IndexManifest
+
+
+def rebuild(model_key, batch_size=512, drop=False):
+    cfg = config.MODELS_CONFIG[model_key]
+    col_name = cfg["collection_name"]
+    db = DBManager()
+
+    if drop and db.client.has_collection(col_name):
+        print(f"🗑️ Dropping existing collection '{col_name}'...")
+        db.client.drop_collection(col_name)
+    # قبل از ensure_collection: کالکشن نبود (پاک شده) -> manifest قدیمی ریست می‌شود
+    manifest = IndexManifest(col_name)
+    manifest.sync(db, model_key)
+    db.ensure_collection(model_key)
+
+    cache = EmbeddingCache(cfg["model_id"])
+    print(f"📦 Cache for {cfg['model_id']} holds {len(cache)} vectors / {len(cache.paths)} paths.")
+
+    total = 0
+    for paths, vectors in cache.iter_batches(batch_size=batch_size):
+        # فایل‌هایی که از قبل در کالکشن هستند دوباره اینسرت نشوند
+        todo, stale_ids, _ = manifest.plan(paths)
+        if stale_ids:
+            # نسخه قدیمی فایل‌های تغییرکرده حذف شود تا تکراری نشوند
+            db.delete_by_ids(model_key, stale_ids)
+        if not todo: continue
+        keep = set(todo)
+        idx = [i for i, p in enumerate(paths) if p in keep]
+        res = db.insert_images(model_key, vectors[idx], todo)
+        manifest.record(todo, list(res["ids"]) if res and "ids" in res else None)
+        total += len(todo)
+        print(f"🚀 Inserted {total} rows...")
+
+    print(f"🎉 Rebuilt '{col_name}' from cache with {total} new rows (no model inference).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a Milvus collection from the on-disk embedding cache.")
+    parser.add_argument("model", choices=list(config.MODELS_CONFIG.keys()))
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--drop", action="store_true", help="drop the collection first")
+    args = parser.parse_args()
+    rebuild(args.model, batch_size=args.batch_size, drop=args.drop)